@@ -0,0 +1,230 @@
+"""
+Benchmarks for the hot paths of sampling and multilevel splitting.
+
+Problems are orthant-type domains A x + b >= 0 where the M <= D rows of A are orthonormal, such that the domain
+probability is known in closed form and can be set to any target value.
+
+Run from the repository root with
+    python -m benchmarks --output results.json
+and compare two runs (e.g. of different commits) with
+    python -m benchmarks --output new.json --compare results.json
+"""
+import argparse
+import itertools
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from statistics import NormalDist
+
+import numpy as np
+
+from LinConGauss import LinearConstraints
+from LinConGauss.sampling import Ellipse, ActiveIntersections, EllipticalSliceSampler
+from LinConGauss.multilevel_splitting import SubsetSimulation, HDR
+
+BENCHMARKS = ('active_intersections', 'ess', 'subset_simulation', 'hdr')
+
+
+def make_problem(dim, n_constraints, probability, seed=0):
+    """
+    Linear constraints with orthonormal rows and known domain probability
+    :param dim: dimension D
+    :param n_constraints: number of constraints M <= D
+    :param probability: probability of the domain under the standard normal
+    :param seed: random seed for the rotation
+    :return: LinearConstraints instance and a point inside the domain, shape (D, 1)
+    """
+    if n_constraints > dim:
+        raise ValueError('Benchmark problems require M <= D.')
+
+    rng = np.random.RandomState(seed)
+    Q, _ = np.linalg.qr(rng.randn(dim, dim))
+    A = Q[:n_constraints]
+    b = NormalDist().inv_cdf(probability ** (1. / n_constraints)) * np.ones((n_constraints, 1))
+
+    # A @ A.T = I, hence A.T @ (1 - b) satisfies all constraints with margin 1
+    x_in = np.dot(A.T, 1. - b)
+    return LinearConstraints(A, b), x_in
+
+
+def _measure(fun, memory):
+    """
+    Run fun once for timing and, if requested, once more for its peak memory (tracemalloc slows down execution)
+    :param fun: callable without arguments
+    :param memory: whether to measure peak memory
+    :return: return value of fun and dictionary with wall time, CPU time and peak memory
+    """
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = fun()
+    stats = {'wall_time': time.perf_counter() - wall, 'cpu_time': time.process_time() - cpu}
+
+    if memory:
+        tracemalloc.start()
+        fun()
+        stats['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, stats
+
+
+def bench_active_intersections(lincon, x_in, n_skip, config):
+    n_calls = config['n_calls']
+    ellipses = [Ellipse(x_in, np.random.randn(lincon.N_dim, 1)) for _ in range(n_calls)]
+
+    def fun():
+        for ellipse in ellipses:
+            ActiveIntersections(ellipse, lincon).find_active_intersections()
+
+    _, stats = _measure(fun, config['memory'])
+    stats['calls_per_second'] = n_calls / stats['wall_time']
+    return stats
+
+
+def bench_ess(lincon, x_in, n_skip, config):
+    n_samples = config['n_samples_ess']
+
+    def fun():
+        sampler = EllipticalSliceSampler(n_samples, lincon, n_skip, x_in)
+        sampler.run()
+
+    _, stats = _measure(fun, config['memory'])
+    stats['samples_per_second'] = n_samples / stats['wall_time']
+    return stats
+
+
+def bench_subset_simulation(lincon, x_in, n_skip, config):
+    def fun():
+        subset_simulator = SubsetSimulation(lincon, config['n_samples_subset'], 0.5, n_skip)
+        subset_simulator.run(verbose=False)
+        return subset_simulator
+
+    subset_simulator, stats = _measure(fun, config['memory'])
+    n_nestings = subset_simulator.tracker.n_nestings()
+    stats['n_nestings'] = n_nestings
+    stats['samples_per_second'] = n_nestings * config['n_samples_subset'] / stats['wall_time']
+    return stats
+
+
+def bench_hdr(lincon, x_in, n_skip, config):
+    subset_simulator = SubsetSimulation(lincon, config['n_samples_subset'], 0.5, n_skip)
+    subset_simulator.run(verbose=False)
+    shifts = subset_simulator.tracker.shift_sequence
+    x_inits = subset_simulator.tracker.x_inits()
+
+    def fun():
+        hdr = HDR(lincon, shifts, config['n_samples_hdr'], x_inits, n_skip)
+        hdr.run()
+        return hdr.tracker.log_integral()
+
+    log_integrals, all_stats = [], []
+    for r in range(config['repeats']):
+        log_integral, stats = _measure(fun, config['memory'] and r == 0)
+        log_integrals.append(log_integral)
+        all_stats.append(stats)
+
+    stats = {key: float(np.mean([s[key] for s in all_stats if key in s])) for key in all_stats[0]}
+    variance = float(np.var(log_integrals, ddof=1)) if len(log_integrals) > 1 else float('nan')
+    stats['n_nestings'] = len(shifts)
+    stats['samples_per_second'] = len(shifts) * config['n_samples_hdr'] / stats['wall_time']
+    stats['log_integral_mean'] = float(np.mean(log_integrals))
+    stats['log_integral_variance'] = variance
+    # precision per unit of compute: inverse of variance times runtime
+    stats['inverse_variance_per_second'] = 1. / (variance * stats['wall_time'])
+    return stats
+
+
+def run(dims, n_constraints, probabilities, n_skips, benchmarks, config, verbose=True):
+    """
+    Run all benchmarks on the grid of problem settings
+    :return: list of result dictionaries
+    """
+    functions = {'active_intersections': bench_active_intersections, 'ess': bench_ess,
+                 'subset_simulation': bench_subset_simulation, 'hdr': bench_hdr}
+    results = []
+    for dim, m, probability, n_skip in itertools.product(dims, n_constraints, probabilities, n_skips):
+        if m > dim:
+            continue
+        lincon, x_in = make_problem(dim, m, probability)
+        for name in benchmarks:
+            np.random.seed(config['seed'])
+            stats = functions[name](lincon, x_in, n_skip, config)
+            result = {'benchmark': name, 'dim': dim, 'n_constraints': m, 'probability': probability,
+                      'log_probability': float(np.log(probability)), 'n_skip': n_skip}
+            result.update(stats)
+            results.append(result)
+            if verbose:
+                print('{benchmark:>20s}  D={dim:<5d} M={n_constraints:<5d} p={probability:<8.0e} '
+                      'n_skip={n_skip:<3d} wall={wall_time:.3f}s cpu={cpu_time:.3f}s'.format(**result))
+    return results
+
+
+def metadata():
+    """ Information that identifies a benchmark run """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'commit': commit, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'numpy': np.__version__,
+            'python': platform.python_version(), 'machine': platform.machine(), 'processor': platform.processor()}
+
+
+def compare(results, baseline, threshold=1.1):
+    """
+    Print the ratio of wall times between two benchmark runs
+    :param results: list of result dictionaries of the current run
+    :param baseline: list of result dictionaries of the reference run
+    :param threshold: ratios above this value are flagged as regressions
+    :return: number of regressions
+    """
+    keys = ('benchmark', 'dim', 'n_constraints', 'probability', 'n_skip')
+    reference = {tuple(r[k] for k in keys): r for r in baseline}
+    n_regressions = 0
+    for result in results:
+        key = tuple(result[k] for k in keys)
+        if key not in reference:
+            continue
+        ratio = result['wall_time'] / reference[key]['wall_time']
+        flag = 'REGRESSION' if ratio > threshold else ''
+        n_regressions += ratio > threshold
+        print('{:>20s}  D={:<5d} M={:<5d} p={:<8.0e} n_skip={:<3d} {:6.2f}x {}'.format(*key, ratio, flag))
+    return n_regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks for LinConGauss sampling and multilevel splitting')
+    parser.add_argument('--dims', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--n-constraints', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--probabilities', type=float, nargs='+', default=[1e-2, 1e-4, 1e-8, 1e-12])
+    parser.add_argument('--n-skips', type=int, nargs='+', default=[0, 4])
+    parser.add_argument('--benchmarks', nargs='+', default=list(BENCHMARKS), choices=BENCHMARKS)
+    parser.add_argument('--n-calls', type=int, default=1000, help='calls of find_active_intersections')
+    parser.add_argument('--n-samples-ess', type=int, default=1000, help='samples drawn by the ESS benchmark')
+    parser.add_argument('--n-samples-subset', type=int, default=64, help='samples per subset simulation nesting')
+    parser.add_argument('--n-samples-hdr', type=int, default=256, help='samples per HDR nesting')
+    parser.add_argument('--repeats', type=int, default=5, help='HDR repetitions to estimate the variance')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory measurement')
+    parser.add_argument('--quick', action='store_true', help='small grid for smoke testing')
+    parser.add_argument('--output', help='JSON file the results are written to')
+    parser.add_argument('--compare', help='JSON file of a previous run to compare wall times against')
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.dims, args.n_constraints, args.probabilities, args.n_skips = [10], [5, 10], [1e-2, 1e-6], [0]
+        args.n_calls, args.n_samples_ess, args.repeats = 200, 200, 3
+
+    config = {'n_calls': args.n_calls, 'n_samples_ess': args.n_samples_ess,
+              'n_samples_subset': args.n_samples_subset, 'n_samples_hdr': args.n_samples_hdr,
+              'repeats': args.repeats, 'seed': args.seed, 'memory': not args.no_memory}
+    results = run(args.dims, args.n_constraints, args.probabilities, args.n_skips, args.benchmarks, config)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'metadata': metadata(), 'config': config, 'results': results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        print('\nwall time relative to {}'.format(args.compare))
+        compare(results, baseline)
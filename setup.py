@@ -13,4 +13,7 @@ setup(
     install_requires=[
         "numpy >= 1.15.4",
     ],
+    entry_points={
+        'console_scripts': ['lincongauss = LinConGauss.cli:main'],
+    },
 )
@@ -0,0 +1,244 @@
+"""
+Command line interface that integrates batches of linearly constrained Gaussian problems.
+
+Every problem is a .npz file that holds the constraint matrix A (M, D), the offsets b (M, 1) and optionally any of the
+options in OPTIONS (e.g. n_samples), which override the command line defaults. Problems are given as a directory of
+.npz files, a single .npz file, or a manifest with one JSON object per line, e.g.
+    {"path": "problems/p1.npz", "name": "p1", "n_samples": 512}
+where paths are relative to the manifest and all keys but path and name override options of the problem.
+
+Every problem runs subset simulation followed by HDR in its own worker process, with at most n_jobs at a time, and
+the results are appended to the output file as one JSON object per line as soon as a problem finishes:
+    lincongauss problems/ --output results.jsonl --n-jobs 4 --time-limit 600 --memory-limit 4096
+Problems that fail or exceed their time or memory limit are retried, with a new random stream per attempt. With
+--cache, shift sequences are kept on disk and repeated problems skip subset simulation (see ShiftSequenceCache).
+"""
+import argparse
+import collections
+import glob
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import time
+import traceback
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    # memory limits are only available on Unix
+    resource = None
+
+from . import LinearConstraints
+from .multilevel_splitting import ShiftSequenceCache, integrate
+
+OPTIONS = {'n_samples': 256, 'n_samples_subset': 64, 'domain_fraction': 0.5, 'n_skip': 0, 'mode': 'Intersection',
+           'seed': None}
+
+
+def load_problems(source):
+    """
+    List the problems of a directory of .npz files, a single .npz file or a manifest
+    :param source: path of the directory, .npz file or manifest
+    :return: list of dictionaries with name, path and options of every problem
+    """
+    if os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, '*.npz')))
+        return [{'name': os.path.splitext(os.path.basename(path))[0], 'path': path, 'options': {}} for path in paths]
+    if source.endswith('.npz'):
+        return [{'name': os.path.splitext(os.path.basename(source))[0], 'path': source, 'options': {}}]
+
+    problems = []
+    with open(source) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            path = os.path.join(os.path.dirname(source), entry.pop('path'))
+            name = entry.pop('name', os.path.splitext(os.path.basename(path))[0])
+            unknown = set(entry) - set(OPTIONS)
+            if unknown:
+                raise ValueError('Unknown options {} for problem {}.'.format(sorted(unknown), name))
+            problems.append({'name': name, 'path': path, 'options': entry})
+    return problems
+
+
+def problem_options(path, options=None, defaults=None):
+    """
+    Options of a problem, in order of precedence the given options, those stored in the file, the defaults and OPTIONS
+    :param path: path of the .npz file
+    :param options: (optional) options that override those stored in the file
+    :param defaults: (optional) options for those neither given nor stored in the file
+    :return: dictionary with all options
+    """
+    merged = dict(OPTIONS)
+    merged.update(defaults or {})
+    with np.load(path) as data:
+        merged.update({key: data[key].item() for key in OPTIONS if key in data.files})
+    merged.update(options or {})
+    return merged
+
+
+def solve_problem(path, options=None, defaults=None, rng=None, cache=None):
+    """
+    Integrate the Gaussian over the domain of one problem with subset simulation followed by HDR
+    :param path: path of the .npz file with A, b and optionally options
+    :param options: (optional) options that override those stored in the file (see problem_options)
+    :param defaults: (optional) options for those neither given nor stored in the file
+    :param rng: (optional) random number generator or seed (see get_rng), by default a Generator seeded with the seed
+    option
+    :param cache: (optional) ShiftSequenceCache instance, which skips subset simulation for repeated problems
+    :return: dictionary with log integral, conditional probabilities of the nestings and timings
+    """
+    options = problem_options(path, options, defaults)
+    with np.load(path) as data:
+        A, b = data['A'], data['b']
+    if rng is None:
+        rng = np.random.default_rng(options['seed'])
+    lincon = LinearConstraints(A, b.reshape(-1, 1), mode=options['mode'])
+
+    hdr, cached, t_subset, t_hdr = integrate(lincon, options['n_samples'], options['n_samples_subset'],
+                                             options['domain_fraction'], options['n_skip'], cache, rng)
+
+    return {'log_integral': float(hdr.tracker.log_integral()),
+            'log2_integral': float(hdr.tracker.log2_integral()),
+            'n_nestings': len(hdr.tracker.nestings),
+            'shift_sequence': [float(shift) for shift in hdr.tracker.shift_sequence],
+            'conditional_probabilities': hdr.tracker.conditional_probabilities.tolist(),
+            'cached_shift_sequence': cached,
+            'timings': {'subset_simulation': t_subset, 'hdr': t_hdr, 'total': t_subset + t_hdr}}
+
+
+def _worker(problem, options, attempt, memory_limit, cache, connection):
+    """
+    Solve one problem in a worker process and send the result through the connection
+    :param problem: dictionary with name, path and options of the problem
+    :param options: default options
+    :param attempt: number of the attempt (starting at 1), which selects the random stream
+    :param memory_limit: (optional) limit of the address space in MiB
+    :param cache: (optional) ShiftSequenceCache instance
+    :param connection: connection to the scheduler
+    :return: None
+    """
+    if memory_limit is not None:
+        limit = int(memory_limit * 2**20)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    try:
+        seed = problem_options(problem['path'], problem['options'], options)['seed']
+        if attempt > 1:
+            seed = np.random.SeedSequence(seed, spawn_key=(attempt - 1,))
+        result = solve_problem(problem['path'], problem['options'], options, np.random.default_rng(seed), cache)
+        result['status'] = 'ok'
+    except Exception as e:
+        result = {'status': 'failed', 'error': ''.join(traceback.format_exception_only(type(e), e)).strip()}
+    connection.send(result)
+    connection.close()
+
+
+def run_jobs(problems, output, options=None, n_jobs=1, time_limit=None, memory_limit=None, retries=1,
+             verbose=False, cache=None):
+    """
+    Solve problems in worker processes and append one JSON line per problem to the output file as they finish
+    :param problems: list of problems (see load_problems)
+    :param output: path of the output file
+    :param options: (optional) default options, missing ones are taken from OPTIONS
+    :param n_jobs: maximum number of concurrent worker processes
+    :param time_limit: (optional) wall time limit per attempt in seconds, after which the worker is terminated
+    :param memory_limit: (optional) address space limit per worker in MiB (requires the resource module)
+    :param retries: number of further attempts for problems that fail or exceed their limits
+    :param verbose: whether to print a line per finished attempt
+    :param cache: (optional) ShiftSequenceCache instance shared by the workers
+    :return: number of problems that failed in all attempts
+    """
+    options = dict(OPTIONS, **(options or {}))
+    if memory_limit is not None and resource is None:
+        raise ValueError('Memory limits require the resource module, which is only available on Unix.')
+
+    pending = collections.deque((problem, 1) for problem in problems)
+    running = {}
+    n_failed = 0
+    with open(output, 'a') as f:
+        while pending or running:
+            while pending and len(running) < n_jobs:
+                problem, attempt = pending.popleft()
+                receiver, sender = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(target=_worker,
+                                                  args=(problem, options, attempt, memory_limit, cache, sender))
+                process.start()
+                sender.close()
+                running[process] = (problem, attempt, receiver, time.perf_counter())
+
+            timeout = None
+            if time_limit is not None:
+                now = time.perf_counter()
+                timeout = max(min(start + time_limit - now for _, _, _, start in running.values()), 0.)
+            multiprocessing.connection.wait([receiver for _, _, receiver, _ in running.values()], timeout)
+
+            for process, (problem, attempt, receiver, start) in list(running.items()):
+                runtime = time.perf_counter() - start
+                if receiver.poll():
+                    try:
+                        result = receiver.recv()
+                    except EOFError:
+                        # the worker died without a result, e.g. killed for exceeding its memory limit
+                        process.join()
+                        result = {'status': 'failed', 'error': 'worker exited with code {}'.format(process.exitcode)}
+                elif time_limit is not None and runtime > time_limit:
+                    result = {'status': 'timeout', 'error': 'exceeded the time limit of {}s'.format(time_limit)}
+                else:
+                    continue
+
+                process.terminate()
+                process.join()
+                receiver.close()
+                del running[process]
+
+                if verbose:
+                    print('{} (attempt {}): {} after {:.1f}s'.format(problem['name'], attempt, result['status'],
+                                                                   runtime))
+                if result['status'] != 'ok' and attempt <= retries:
+                    pending.append((problem, attempt + 1))
+                    continue
+
+                n_failed += result['status'] != 'ok'
+                record = {'name': problem['name'], 'path': problem['path'], 'attempts': attempt}
+                record.update(result)
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+    return n_failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Integrate batches of linearly constrained Gaussian problems with '
+                                                 'subset simulation and HDR')
+    parser.add_argument('source', help='directory of .npz problems, a single .npz problem or a JSON lines manifest')
+    parser.add_argument('--output', required=True, help='JSON lines file the results are appended to')
+    parser.add_argument('--n-jobs', type=int, default=1, help='number of concurrent worker processes')
+    parser.add_argument('--time-limit', type=float, help='wall time limit per attempt in seconds')
+    parser.add_argument('--memory-limit', type=float, help='memory limit per worker in MiB')
+    parser.add_argument('--retries', type=int, default=1, help='further attempts for failed or timed-out problems')
+    parser.add_argument('--n-samples', type=int, default=OPTIONS['n_samples'], help='samples per HDR nesting')
+    parser.add_argument('--n-samples-subset', type=int, default=OPTIONS['n_samples_subset'],
+                        help='samples per subset simulation nesting')
+    parser.add_argument('--domain-fraction', type=float, default=OPTIONS['domain_fraction'])
+    parser.add_argument('--n-skip', type=int, default=OPTIONS['n_skip'])
+    parser.add_argument('--mode', default=OPTIONS['mode'], choices=['Intersection', 'Union'])
+    parser.add_argument('--seed', type=int, help='seed of every problem (fresh entropy if not given)')
+    parser.add_argument('--cache', help='directory of a cache of shift sequences, which skips subset simulation for '
+                                        'repeated problems')
+    parser.add_argument('--cache-size', type=float, default=1024, help='maximum size of the cache in MiB')
+    parser.add_argument('--quiet', action='store_true', help='do not print a line per finished attempt')
+    args = parser.parse_args(argv)
+
+    options = {key: getattr(args, key) for key in OPTIONS}
+    cache = None if args.cache is None else ShiftSequenceCache(args.cache, int(args.cache_size * 2**20))
+    n_failed = run_jobs(load_problems(args.source), args.output, options, args.n_jobs, args.time_limit,
+                        args.memory_limit, args.retries, not args.quiet, cache)
+    return 1 if n_failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,3 +1,8 @@
-from .linear_constraints import LinearConstraints, ShiftedLinearConstraints
+from .linear_constraints import LinearConstraints, ShiftedLinearConstraints, ShiftedMargins
 from .loop import Loop
 from .loop_state import LoopState
+from .instrumentation import Instrumentation
+from .feasible_point import find_feasible_point
+from .gaussian import Gaussian, cached_cholesky
+from .pruning import prune_constraints
+from .rng import get_rng, spawn_rngs
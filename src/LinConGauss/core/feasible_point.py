@@ -0,0 +1,116 @@
+import numpy as np
+
+
+def find_feasible_point(linear_constraints, candidates=None, margin=1e-3, radius=1e3, tol=1e-8, max_iter=500):
+    """
+    Find a point in the integration domain of linear constraints without random search.
+    In 'Intersection' mode, this solves the phase-I problem max_{x, t} t s.t. a_m x + b_m >= t ||a_m|| for all m and
+    |x_i| <= radius with a log-barrier interior point method, i.e., it maximizes the Euclidean distance of x to the
+    closest hyperplane. The solver returns as soon as the distance exceeds margin. If the barrier method certifies that
+    no point within the box has positive distance, the constraints are reported as infeasible.
+    :param linear_constraints: instance of LinearConstraints
+    :param candidates: (optional) points to check first (e.g. x_inits from subset simulation), shape (D, N)
+    :param margin: desired distance of the point to the boundary of the domain
+    :param radius: half-width of the box |x_i| <= radius that the point is searched in
+    :param tol: tolerance of the duality gap of the barrier method
+    :param max_iter: maximum number of Newton iterations
+    :return: point in the domain, shape (D, 1)
+    """
+    if candidates is not None:
+        inside = np.nonzero(linear_constraints.integration_domain(candidates))[0]
+        if inside.size:
+            return candidates[:, inside[0], None]
+
+    A = linear_constraints.dense_matrix()
+    b = linear_constraints.b[:, 0]
+    norms = np.linalg.norm(A, axis=1)
+
+    # constraints with a zero row are either always or never satisfied
+    constant = norms == 0.
+    A, b = A[~constant] / norms[~constant, None], b[~constant] / norms[~constant]
+
+    if linear_constraints.mode == 'Union':
+        if np.any(linear_constraints.b[constant] >= 0):
+            return np.zeros((linear_constraints.N_dim, 1))
+        if not b.size:
+            raise ValueError('Linear constraints are infeasible: all constraints are constant and negative.')
+        m = np.argmax(b)
+        return (A[m] * max(0., margin - b[m]))[:, None]
+
+    if np.any(linear_constraints.b[constant] < 0):
+        raise ValueError('Linear constraints are infeasible: a constant constraint is negative.')
+    if not b.size:
+        return np.zeros((linear_constraints.N_dim, 1))
+
+    x, t, upper_bound = _maximize_margin(A, b, margin, radius, tol, max_iter)
+    if t <= 0. and upper_bound <= 0.:
+        raise ValueError('Linear constraints are infeasible: no point within |x_i| <= {} satisfies all constraints '
+                         '(the largest distance to the boundary is at most {:.3e}).'.format(radius, upper_bound))
+    if t <= 0.:
+        raise ValueError('No point in the domain of the linear constraints was found within {} iterations (largest '
+                         'distance to the boundary found: {:.3e}).'.format(max_iter, t))
+    return x[:, None]
+
+
+def _maximize_margin(A, b, margin, radius, tol, max_iter):
+    """
+    Log-barrier method for max t s.t. A x + b >= t, |x_i| <= radius, for normalized rows of A
+    :param A: constraint matrix with unit-norm rows, shape (M, D)
+    :param b: offsets, shape (M,)
+    :param margin: return as soon as t >= margin
+    :param radius: half-width of the box
+    :param tol: tolerance of the duality gap
+    :param max_iter: maximum number of Newton iterations
+    :return: x with shape (D,), t and an upper bound of the optimal t (inf if none was certified)
+    """
+    n_constraints, dim = A.shape
+    x = np.zeros(dim)
+    t = np.amin(b) - 1.
+    weight = 1.
+    upper_bound = np.inf
+
+    for i in range(max_iter):
+        if t >= margin:
+            break
+
+        s = A.dot(x) + b - t
+        upper, lower = radius - x, radius + x
+        grad_x = - A.T.dot(1. / s) + 1. / upper - 1. / lower
+        grad_t = - weight + (1. / s).sum()
+        H_xx = np.dot(A.T * (1. / s**2), A) + np.diag(1. / upper**2 + 1. / lower**2)
+        H_xt = - A.T.dot(1. / s**2)
+        H_tt = (1. / s**2).sum()
+
+        H = np.block([[H_xx, H_xt[:, None]], [H_xt[None, :], np.asarray([[H_tt]])]])
+        grad = np.append(grad_x, grad_t)
+        step = - np.linalg.solve(H, grad)
+        decrement = np.dot(grad, step)
+
+        if - decrement < 1e-8:
+            # x is on the central path, where the optimal t is at most t + (M + 2D) / weight
+            gap = (n_constraints + 2 * dim) / weight
+            upper_bound = min(upper_bound, t + gap)
+            if gap < tol or t + gap <= 0.:
+                break
+            weight *= 10.
+            continue
+
+        # backtracking line search that keeps the iterate strictly feasible
+        objective = _barrier(x, t, A, b, radius, weight)
+        alpha = 1.
+        while alpha > 1e-12 and \
+                (not _strictly_feasible(x + alpha * step[:-1], t + alpha * step[-1], A, b, radius) or
+                 _barrier(x + alpha * step[:-1], t + alpha * step[-1], A, b, radius, weight) >
+                 objective + 0.25 * alpha * decrement):
+            alpha *= 0.5
+        x, t = x + alpha * step[:-1], t + alpha * step[-1]
+
+    return x, t, upper_bound
+
+
+def _strictly_feasible(x, t, A, b, radius):
+    return np.all(A.dot(x) + b - t > 0) and np.all(np.absolute(x) < radius)
+
+
+def _barrier(x, t, A, b, radius, weight):
+    return - weight * t - np.log(A.dot(x) + b - t).sum() - np.log(radius - x).sum() - np.log(radius + x).sum()
@@ -0,0 +1,115 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from .linear_constraints import LinearConstraints
+
+# Cholesky factors of recently used covariance matrices, keyed by a hash of their content
+_cholesky_cache = OrderedDict()
+CHOLESKY_CACHE_SIZE = 8
+
+
+def cached_cholesky(cov):
+    """
+    Cholesky factor of a covariance matrix. Factors are cached by the content of the matrix, such that problems that
+    share a covariance skip the O(D^3) factorization.
+    :param cov: covariance matrix, shape (D, D)
+    :return: lower triangular L with cov = L L^T
+    """
+    cov = np.ascontiguousarray(cov)
+    key = hashlib.sha1(str((cov.shape, cov.dtype.str)).encode() + cov.tobytes()).hexdigest()
+
+    if key in _cholesky_cache:
+        _cholesky_cache.move_to_end(key)
+        return _cholesky_cache[key]
+
+    L = np.linalg.cholesky(cov)
+    _cholesky_cache[key] = L
+    if len(_cholesky_cache) > CHOLESKY_CACHE_SIZE:
+        _cholesky_cache.popitem(last=False)
+    return L
+
+
+class Gaussian():
+    def __init__(self, mean, cov=None, chol=None, diag=None, low_rank=None):
+        """
+        Gaussian N(mean, Sigma) for linear constraints in the original space. With x = mean + L z and z standard
+        normal, the constraints A x + b >= 0 become (A L) z + (A mean + b) >= 0, which the samplers and integrators
+        can handle directly. The covariance is given as exactly one of
+        - cov: dense covariance matrix (D, D), whose Cholesky factor is cached (see cached_cholesky)
+        - chol: lower triangular Cholesky factor L (D, D) with Sigma = L L^T
+        - diag and low_rank: Sigma = diag(diag) + U U^T with diag (D,) and U (D, K). Then L = [diag^(1/2), U] with
+        shape (D, D + K) and no factorization is necessary; the whitened space has dimension D + K.
+        :param mean: mean, shape (D, 1)
+        :param cov: (optional) covariance matrix, shape (D, D)
+        :param chol: (optional) lower triangular Cholesky factor of the covariance, shape (D, D)
+        :param diag: (optional) diagonal part of the covariance, shape (D,)
+        :param low_rank: (optional) low-rank factor U of the covariance, shape (D, K)
+        """
+        self.mean = np.asarray(mean).reshape(-1, 1)
+        self.dim = self.mean.shape[0]
+
+        self.L = None
+        self.sqrt_diag = None
+        self.low_rank = None
+        if cov is not None:
+            self.L = cached_cholesky(cov)
+        elif chol is not None:
+            self.L = chol
+        elif diag is not None:
+            self.sqrt_diag = np.sqrt(np.asarray(diag)).reshape(-1, 1)
+            self.low_rank = np.zeros((self.dim, 0)) if low_rank is None else low_rank
+        else:
+            raise ValueError('Either cov, chol or diag (and low_rank) need to be given.')
+
+    @property
+    def whitened_dim(self):
+        """ Dimension of the standard normal space """
+        if self.L is not None:
+            return self.L.shape[1]
+        return self.dim + self.low_rank.shape[1]
+
+    def whiten(self, linear_constraints):
+        """
+        Fold mean and covariance into linear constraints
+        :param linear_constraints: LinearConstraints instance in the original space
+        :return: LinearConstraints instance in the standard normal space
+        """
+        A = linear_constraints.A
+        if self.L is not None:
+            A_whitened = linear_constraints.project(self.L)
+        else:
+            if isinstance(A, np.ndarray):
+                A_diag = A * self.sqrt_diag.T
+            else:
+                A_diag = linear_constraints.project(np.diag(self.sqrt_diag[:, 0]))
+            A_whitened = np.hstack((A_diag, linear_constraints.project(self.low_rank)))
+
+        b_whitened = linear_constraints.evaluate(self.mean)
+        return LinearConstraints(A_whitened, b_whitened, mode=linear_constraints.mode, dtype=linear_constraints.dtype,
+                                 block_size=linear_constraints.block_size)
+
+    def unwhiten(self, Z):
+        """
+        Map standard normal samples to the original space
+        :param Z: samples in the standard normal space, shape (whitened_dim, N)
+        :return: samples mean + L Z, shape (D, N)
+        """
+        if self.L is not None:
+            return self.mean + np.dot(self.L, Z)
+        return self.mean + self.sqrt_diag * Z[:self.dim] + np.dot(self.low_rank, Z[self.dim:])
+
+    def iter_unwhiten(self, Z, chunk_size=1024):
+        """
+        Lazily map standard normal samples to the original space chunk by chunk
+        :param Z: samples, either an array of shape (whitened_dim, N) or an iterable of such arrays (e.g. the chunks
+        of EllipticalSliceSampler.iter_samples)
+        :param chunk_size: number of samples per chunk if Z is an array
+        :return: generator of samples in the original space
+        """
+        chunks = Z
+        if isinstance(Z, np.ndarray):
+            chunks = (Z[:, start:start + chunk_size] for start in range(0, Z.shape[1], chunk_size))
+        for chunk in chunks:
+            yield self.unwhiten(chunk)
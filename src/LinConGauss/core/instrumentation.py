@@ -0,0 +1,82 @@
+import time
+from collections import defaultdict
+
+
+class Instrumentation():
+    def __init__(self):
+        """
+        Collects counters and timers of the sampling loop, in total and per nesting. Pass an instance to the samplers
+        or integration loops to enable it; without one, the loops only pay for a check against None.
+        Counters: ess_steps, samples, intersections, active_slices, out_of_domain_resamples.
+        Timers (seconds): step (total time of ESS steps) and projection (time spent in A @ x).
+        """
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(float)
+        self.nestings = []
+        self._nesting_start = None
+
+    def count(self, name, value=1):
+        """
+        Increment a counter
+        :param name: name of the counter
+        :param value: increment
+        :return: None
+        """
+        self.counters[name] += value
+
+    def add_time(self, name, seconds):
+        """
+        Add to a timer
+        :param name: name of the timer
+        :param seconds: time to add
+        :return: None
+        """
+        self.timers[name] += seconds
+
+    def begin_nesting(self, **info):
+        """
+        Start recording a nesting
+        :param info: information about the nesting (e.g. index and shift) that is stored with its counters
+        :return: None
+        """
+        self._nesting_start = (info, dict(self.counters), dict(self.timers), time.perf_counter())
+
+    def end_nesting(self):
+        """
+        Finish recording a nesting and store the counters and timers accumulated since begin_nesting
+        :return: None
+        """
+        info, counters, timers, start = self._nesting_start
+        record = dict(info)
+        record.update({name: value - counters.get(name, 0) for name, value in self.counters.items()})
+        record.update({name + '_time': value - timers.get(name, 0.) for name, value in self.timers.items()})
+        record['wall_time'] = time.perf_counter() - start
+        if record.get('samples', 0) > 0:
+            record['samples_per_second'] = record['samples'] / record['wall_time']
+        self.nestings.append(record)
+        self._nesting_start = None
+
+    def merge(self, other):
+        """
+        Add the counters, timers and nestings of another instance (e.g. from a worker process)
+        :param other: Instrumentation instance
+        :return: None
+        """
+        for name, value in other.counters.items():
+            self.counters[name] += value
+        for name, value in other.timers.items():
+            self.timers[name] += value
+        self.nestings.extend(other.nestings)
+
+    def to_dict(self):
+        """
+        Export all recorded quantities
+        :return: dictionary with totals and per-nesting records
+        """
+        totals = dict(self.counters)
+        totals.update({name + '_time': value for name, value in self.timers.items()})
+        if 'step' in self.timers:
+            totals['overhead_time'] = self.timers['step'] - self.timers.get('projection', 0.)
+        if self.timers.get('step', 0.) > 0 and 'samples' in self.counters:
+            totals['samples_per_second'] = self.counters['samples'] / self.timers['step']
+        return {'totals': totals, 'nestings': list(self.nestings)}
@@ -1,19 +1,63 @@
 import numpy as np
 
+# default maximum number of entries of A @ x that are held in memory at once when reducing over constraints
+BLOCK_SIZE = 2**22
+# number of samples per block if the evaluation is split into blocks
+SAMPLE_CHUNK_SIZE = 4096
+
+
 class LinearConstraints():
-    def __init__(self, A, b, mode='Intersection'):
+    def __init__(self, A, b, mode='Intersection', dtype=None, block_size=None):
         """
         Defines linear functions f(x) = Ax + b.
         The integration domain is defined as the union of where all of these functions are positive if mode='Union'
         or the domain where any of the functions is positive, when mode='Intersection'
-        :param A: matrix A with shape (M, D) where M is the number of constraints and D the dimension
+        :param A: matrix A with shape (M, D) where M is the number of constraints and D the dimension. Besides dense
+        arrays, A can be a sparse matrix (e.g. scipy.sparse CSR) or any linear operator with a shape attribute and a
+        matmat method (e.g. scipy.sparse.linalg.LinearOperator). A can also be a np.memmap, which is then read from
+        disk block by block when evaluating the integration domain.
         :param b: offset, shape (M, 1)
+        :param mode: 'Intersection' or 'Union'
+        :param dtype: (optional) floating point type of A, b and the samples, e.g. np.float32 to halve memory traffic
+        and the size of stored samples (float64 if not given, in which case A and b are used as they are). Angles and
+        log probabilities are always computed in float64.
+        :param block_size: (optional) maximum number of entries of A @ x that integration_domain, the indicators and
+        min_evaluation hold in memory at once (defaults to BLOCK_SIZE)
         """
+        if dtype is not None:
+            A = A.astype(dtype, copy=False) if hasattr(A, 'astype') else A
+            b = np.asarray(b, dtype=dtype)
         self.A = A
         self.b = b
+        self.dtype = np.dtype(np.float64 if dtype is None else dtype)
         self.N_constraints = b.shape[0]
         self.N_dim = A.shape[1]
         self.mode = mode
+        self.block_size = BLOCK_SIZE if block_size is None else block_size
+
+    def project(self, x):
+        """
+        Apply the constraint matrix to N locations x. This is the only place where A is accessed during sampling and
+        integration, such that the cost scales with the number of non-zeros for sparse or structured A.
+        :param x: location, shape (D, N)
+        :return: Ax, shape (M, N)
+        """
+        if isinstance(self.A, np.ndarray):
+            return np.dot(self.A, x)
+        elif hasattr(self.A, 'matmat'):
+            return self.A.matmat(x)
+        return np.asarray(self.A @ x)
+
+    def dense_matrix(self):
+        """
+        The constraint matrix as dense array, materialized if A is a sparse matrix or a linear operator
+        :return: A, shape (M, D)
+        """
+        if isinstance(self.A, np.ndarray):
+            return self.A
+        elif hasattr(self.A, 'toarray'):
+            return self.A.toarray()
+        return self.project(np.eye(self.N_dim))
 
     def evaluate(self, x):
         """
@@ -21,7 +65,7 @@ class LinearConstraints():
         :param x: location, shape (D, N)
         :return: Ax + b
         """
-        return np.dot(self.A, x) + self.b
+        return self.project(x) + self.b
 
     def integration_domain(self, x):
         """
@@ -36,13 +80,57 @@ class LinearConstraints():
         else:
             raise NotImplementedError
 
+    def integration_domain_from_evaluation(self, fx):
+        """
+        Same as self.integration_domain, but for linear functions that have already been evaluated
+        :param fx: evaluated linear functions Ax + b, shape (M, N)
+        :return: 1 if the respective column of fx is in the integration domain, else 0
+        """
+        if self.mode == 'Union':
+            return np.any(fx >= 0, axis=0).astype(int)
+        elif self.mode == 'Intersection':
+            return np.all(fx >= 0, axis=0).astype(int)
+        else:
+            raise NotImplementedError
+
+    def margin_from_evaluation(self, fx):
+        """
+        Margin of evaluated linear functions, i.e. the smallest (mode='Intersection') or largest (mode='Union') value,
+        which is >= 0 if and only if the respective column of fx is in the integration domain
+        :param fx: evaluated linear functions Ax + b, shape (M, N)
+        :return: margins, shape (N,)
+        """
+        if self.mode == 'Union':
+            return np.amax(fx, axis=0)
+        elif self.mode == 'Intersection':
+            return np.amin(fx, axis=0)
+        else:
+            raise NotImplementedError
+
+    def min_evaluation(self, x):
+        """
+        Smallest value of the linear functions at N locations x, evaluated block by block
+        :param x: location, shape (D, N)
+        :return: min_m (Ax + b)_m, shape (N,)
+        """
+        n_samples = x.shape[1]
+        row_chunk, column_chunk = self._chunk_sizes(n_samples)
+        minimum = np.empty(n_samples, dtype=np.result_type(self.dtype, x))
+        for start in range(0, n_samples, column_chunk):
+            columns = slice(start, start + column_chunk)
+            minimum[columns] = np.amin(self._evaluate_rows(slice(0, row_chunk), x[:, columns]), axis=0)
+            for row in range(row_chunk, self.N_constraints, row_chunk):
+                np.minimum(minimum[columns], np.amin(self._evaluate_rows(slice(row, row + row_chunk), x[:, columns]),
+                                                     axis=0), out=minimum[columns])
+        return minimum
+
     def indicator_intersection(self, x):
         """
         Intersection of indicator functions taken to be 1 when the linear function is >= 0
         :param x: location, shape (D, N)
         :return: 1 if all linear functions are >= 0, else 0.
         """
-        return np.where(self.evaluate(x) >= 0, 1, 0).prod(axis=0)
+        return self._indicator(x, union=False)
 
     def indicator_union(self, x):
         """
@@ -50,17 +138,111 @@ class LinearConstraints():
         :param x: location, shape (D, N)
         :return: 1 if any of the linear functions is >= 0, else 0.
         """
-        return 1 - (np.where(self.evaluate(x) >= 0, 0, 1)).prod(axis=0)
+        return self._indicator(x, union=True)
+
+    def _indicator(self, x, union):
+        """
+        Evaluate the indicators block by block over samples and constraints. A sample is no longer evaluated once it is
+        known to be outside (intersection) or inside (union) the domain.
+        :param x: location, shape (D, N)
+        :param union: whether to compute the union or intersection of the indicator functions
+        :return: indicators, shape (N,)
+        """
+        n_samples = x.shape[1]
+        row_chunk, column_chunk = self._chunk_sizes(n_samples)
+        indicator = np.full(n_samples, not union)
+        for start in range(0, n_samples, column_chunk):
+            undecided = np.arange(start, min(start + column_chunk, n_samples))
+            for row in range(0, self.N_constraints, row_chunk):
+                fx = self._evaluate_rows(slice(row, row + row_chunk), x[:, undecided])
+                decided = np.any(fx >= 0, axis=0) if union else np.any(fx < 0, axis=0)
+                indicator[undecided[decided]] = union
+                undecided = undecided[~decided]
+                if not undecided.size:
+                    break
+        return indicator.astype(int)
+
+    def _chunk_sizes(self, n_samples):
+        """
+        Number of constraints and samples per block, such that a block has at most block_size entries. Only dense
+        (and memory-mapped) arrays and CSR matrices are split into constraints.
+        :param n_samples: number of samples
+        :return: number of constraints and number of samples per block
+        """
+        if self.N_constraints * n_samples <= self.block_size:
+            return self.N_constraints, max(n_samples, 1)
+        if not (isinstance(self.A, np.ndarray) or getattr(self.A, 'format', None) == 'csr'):
+            return self.N_constraints, max(self.block_size // self.N_constraints, 1)
+        column_chunk = min(n_samples, SAMPLE_CHUNK_SIZE)
+        return min(self.N_constraints, max(self.block_size // column_chunk, 1)), column_chunk
+
+    def _evaluate_rows(self, rows, x):
+        """
+        Evaluate a block of linear functions
+        :param rows: slice of constraints
+        :param x: location, shape (D, N)
+        :return: (Ax + b)[rows], shape (len(rows), N)
+        """
+        if rows.start == 0 and rows.stop >= self.N_constraints:
+            return self.evaluate(x)
+        if isinstance(self.A, np.ndarray):
+            return np.dot(self.A[rows], x) + self.b[rows]
+        return np.asarray(self.A[rows] @ x) + self.b[rows]
 
 
 
 class ShiftedLinearConstraints(LinearConstraints):
-    def __init__(self, A, b, shift):
+    def __init__(self, A, b, shift, dtype=None, block_size=None, mode='Intersection'):
         """
         Class for shifted linear constraints that appear in multilevel splitting method
         :param A: matrix A with shape (M, D) where M is the number of constraints and D the dimension
         :param b: offset, shape (M, 1)
         :param shift: (positive) scalar value denoting the shift
+        :param dtype: (optional) floating point type, see LinearConstraints
+        :param block_size: (optional) maximum number of entries of A @ x in memory, see LinearConstraints
+        :param mode: 'Intersection' or 'Union', the mode of the unshifted constraints
         """
         self.shift = shift
-        super(ShiftedLinearConstraints, self).__init__(A, b + shift)
\ No newline at end of file
+        super(ShiftedLinearConstraints, self).__init__(A, b + shift, mode=mode, dtype=dtype, block_size=block_size)
+
+class ShiftedMargins():
+    def __init__(self, linear_constraints, X=None, AX=None, margins=None):
+        """
+        Shift-aware view of linear constraints at fixed samples. The nested domains {Ax + b + shift >= 0} only differ
+        in the shift, hence the margin of a sample (see margin_from_evaluation: min_m (Ax + b)_m for
+        mode='Intersection', max_m (Ax + b)_m for mode='Union') decides its membership for every shift: the sample lies
+        in the nesting if and only if margin + shift >= 0. The margins are computed once from (in this order of preference) given
+        margins, precomputed A @ X, or the samples.
+        :param linear_constraints: instance of LinearConstraints (without shift)
+        :param X: (optional) samples, shape (D, N)
+        :param AX: (optional) precomputed A @ X, shape (M, N)
+        :param margins: (optional) precomputed margins, shape (N,)
+        """
+        if margins is None:
+            if AX is not None:
+                margins = linear_constraints.margin_from_evaluation(AX + linear_constraints.b)
+            elif linear_constraints.mode == 'Intersection':
+                # evaluated block by block, without the full (M, N) constraint values
+                margins = linear_constraints.min_evaluation(X)
+            else:
+                margins = linear_constraints.margin_from_evaluation(linear_constraints.evaluate(X))
+        self.margins = margins
+        self._sorted_margins = None
+
+    def integration_domain(self, shift=0.):
+        """
+        is 1 if the sample is in the nesting with the given shift, else 0
+        :param shift: shift of the nesting
+        :return: indicators, shape (N,)
+        """
+        return (self.margins + shift >= 0).astype(int)
+
+    def n_inside(self, shifts):
+        """
+        Number of samples inside the nestings of all given shifts at once, by a search in the sorted margins
+        :param shifts: shifts, shape (L,)
+        :return: number of samples inside each nesting, shape (L,)
+        """
+        if self._sorted_margins is None:
+            self._sorted_margins = np.sort(self.margins)
+        return self.margins.shape[0] - np.searchsorted(self._sorted_margins, -np.asarray(shifts), side='left')
@@ -0,0 +1,80 @@
+import numpy as np
+
+from .linear_constraints import LinearConstraints
+
+
+def prune_constraints(linear_constraints, remove_redundant=True, tol=1e-12):
+    """
+    Reduce linear constraints to an equivalent, smaller set without solving linear programs.
+    Rows are normalized to unit norm and constraints with the same normal vector are merged into the tightest one
+    ('Intersection') or the loosest one ('Union'). Constant constraints (zero rows) that do not affect the domain are
+    dropped. If remove_redundant is set, a constraint of an intersection is further removed if it is implied by the box
+    that the constraints on single variables define, i.e. if it is satisfied at every corner of the box.
+    :param linear_constraints: instance of LinearConstraints (sparse matrices and linear operators are made dense)
+    :param remove_redundant: whether to remove constraints that are implied by the bounds on single variables
+    :param tol: tolerance up to which normal vectors are considered equal
+    :return: LinearConstraints with the reduced constraints, and index map of shape (M,), which holds for every original
+    constraint the index of the reduced constraint it was merged into, or -1 if it was removed
+    """
+    union = linear_constraints.mode == 'Union'
+    A = linear_constraints.dense_matrix()
+    b = linear_constraints.b[:, 0]
+    norms = np.linalg.norm(A, axis=1)
+    index_map = np.full(A.shape[0], -1)
+
+    # constant constraints only matter if they are violated (intersection) or satisfied (union)
+    constant = norms == 0.
+    relevant = (b >= 0) == union
+    if np.any(constant & relevant):
+        # an empty intersection, or a union that covers the whole space, is represented by one constant constraint
+        m = np.nonzero(constant & relevant)[0][0]
+        index_map[m] = 0
+        return _reduced(linear_constraints, A[m, None], b[m, None]), index_map
+
+    rows = np.nonzero(~constant)[0]
+    A, b = A[rows] / norms[rows, None], b[rows] / norms[rows]
+
+    # merge constraints with the same normal vector into the tightest (intersection) or loosest (union) one
+    _, group, inverse = np.unique(np.round(A / tol), axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    b_merged = np.full(group.shape[0], -np.inf if union else np.inf)
+    (np.maximum if union else np.minimum).at(b_merged, inverse, b)
+    A_merged = A[group]
+
+    keep = np.ones(group.shape[0], dtype=bool)
+    if remove_redundant and not union:
+        keep = ~_implied_by_bounds(A_merged, b_merged)
+
+    new_index = np.cumsum(keep) - 1
+    index_map[rows] = np.where(keep[inverse], new_index[inverse], -1)
+    return _reduced(linear_constraints, A_merged[keep], b_merged[keep]), index_map
+
+
+def _implied_by_bounds(A, b):
+    """
+    Find constraints a x + b >= 0 on several variables that are implied by the constraints on single variables. These
+    define the box lower <= x <= upper, and min_{x in box} a x + b = b + sum_i min(a_i lower_i, a_i upper_i).
+    :param A: constraint matrix with unit-norm rows and unique normal vectors, shape (M, D)
+    :param b: offsets, shape (M,)
+    :return: boolean mask of implied constraints, shape (M,)
+    """
+    single = np.count_nonzero(A, axis=1) == 1
+    lower = np.full(A.shape[1], -np.inf)
+    upper = np.full(A.shape[1], np.inf)
+    for m in np.nonzero(single)[0]:
+        i = np.nonzero(A[m])[0][0]
+        # a_i x_i + b >= 0 with a_i = +-1
+        if A[m, i] > 0:
+            lower[i] = -b[m]
+        else:
+            upper[i] = b[m]
+
+    with np.errstate(invalid='ignore'):
+        smallest = np.where(A > 0, A * lower, np.where(A < 0, A * upper, 0.))
+    return ~single & (b + smallest.sum(axis=1) >= 0)
+
+
+def _reduced(linear_constraints, A, b):
+    """ Reduced constraints with the settings of the original ones """
+    return LinearConstraints(A, b[:, None], mode=linear_constraints.mode, dtype=linear_constraints.dtype,
+                             block_size=linear_constraints.block_size)
@@ -0,0 +1,49 @@
+import numpy as np
+
+
+def get_rng(rng=None):
+    """
+    Random number generator from a seed or generator. Samplers, nestings and integrators only use the methods
+    standard_normal, random and choice, which the global numpy random state, RandomState and Generator share.
+    :param rng: None for the global numpy random state (np.random.seed applies), an integer or SeedSequence for a new
+    numpy.random.Generator, or a Generator or RandomState that is used as is
+    :return: random number generator
+    """
+    if rng is None:
+        return np.random
+    if rng is np.random or isinstance(rng, (np.random.Generator, np.random.RandomState)):
+        return rng
+    return np.random.default_rng(rng)
+
+
+def standard_normal(rng, size, dtype=np.float64):
+    """
+    Draw standard normal samples in the given precision. Generators draw single precision samples directly, which is
+    faster than casting double precision ones.
+    :param rng: random number generator (see get_rng)
+    :param size: shape of the output
+    :param dtype: np.float32 or np.float64
+    :return: samples with the given shape
+    """
+    if isinstance(rng, np.random.Generator):
+        return rng.standard_normal(size, dtype=dtype)
+    return rng.standard_normal(size).astype(dtype, copy=False)
+
+
+def spawn_rngs(rng, n, entropy=None):
+    """
+    Spawn independent child generators, e.g. one per nesting or chain, via a SeedSequence whose entropy (four 63 bit
+    integers) is drawn from the parent. The children only depend on the state of the parent, not on how they are
+    distributed to workers.
+    :param rng: parent random number generator (see get_rng)
+    :param n: number of children
+    :param entropy: (optional) entropy of an earlier call, which spawns the same children again without using rng
+    :return: entropy of the SeedSequence (list of integers) and list of n Generators
+    """
+    if entropy is None:
+        if isinstance(rng, np.random.Generator):
+            entropy = rng.integers(0, 2**63, size=4)
+        else:
+            entropy = rng.randint(0, 2**63, size=4, dtype=np.int64)
+    entropy = [int(e) for e in np.atleast_1d(entropy)]
+    return entropy, [np.random.default_rng(seed) for seed in np.random.SeedSequence(entropy).spawn(n)]
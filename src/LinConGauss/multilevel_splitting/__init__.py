@@ -1,5 +1,9 @@
 from .holmes_diaconis_ross import HDR
 from .subset_simulation import SubsetSimulation
-from .integration_tracker import HDRTracker, SubsetSimulationTracker
+from .integration_tracker import HDRTracker, SubsetSimulationTracker, BatchIntegrationTracker
 from .integration_loop import IntegrationLoop
-from .nestings import HDRNesting, SubsetNesting
\ No newline at end of file
+from .nestings import HDRNesting, SubsetNesting
+from .batch_integration import BatchIntegration
+from .checkpoint import Checkpoint
+from .shift_cache import ShiftSequenceCache, constraint_hash
+from .integration import integrate
@@ -0,0 +1,102 @@
+import numpy as np
+
+from .. import LinearConstraints, get_rng
+from ..core.rng import standard_normal
+from .holmes_diaconis_ross import HDR
+from .subset_simulation import SubsetSimulation
+from .integration_tracker import BatchIntegrationTracker
+
+
+class BatchIntegration():
+    def __init__(self, A, B, n_samples, n_samples_subset, domain_fraction, n_skip=0, warm_start=True,
+                 mode='Intersection', dtype=None, rng=None):
+        """
+        Integrate a Gaussian over the domains defined by one constraint matrix A and many offsets b. Standard normal
+        samples of the first nesting and their projections A @ X are shared by all offsets, and if warm_start is set,
+        the shift sequence and starting points of the previous offset are recycled whenever they remain valid.
+        Offsets should therefore be ordered such that neighbouring columns of B are similar.
+        :param A: matrix A with shape (M, D) (dense, sparse or linear operator, see LinearConstraints)
+        :param B: offsets, shape (M, L), one column per integral
+        :param n_samples: number of samples per nesting in HDR (integer)
+        :param n_samples_subset: number of samples per nesting in subset simulation (integer)
+        :param domain_fraction: fraction of samples that should lie in each new subset (between 0 and 1)
+        :param n_skip: number of samples to skip in ESS
+        :param warm_start: whether to recycle the shift sequence of the previous offset
+        :param mode: 'Intersection' or 'Union', see LinearConstraints
+        :param dtype: (optional) floating point type, see LinearConstraints
+        :param rng: (optional) random number generator or seed (see get_rng), defaults to the global numpy random state
+        """
+        # cast once, such that the offsets share the constraint matrix
+        self.A = A.astype(dtype, copy=False) if dtype is not None and hasattr(A, 'astype') else A
+        self.B = B
+        self.n_samples = n_samples
+        self.n_samples_subset = n_samples_subset
+        self.domain_fraction = domain_fraction
+        self.n_skip = n_skip
+        self.warm_start = warm_start
+        self.mode = mode
+        self.dtype = dtype
+        self.rng = get_rng(rng)
+
+        self.tracker = BatchIntegrationTracker()
+
+    def run(self, verbose=False):
+        """
+        Run subset simulation (unless warm-started) and HDR for every offset
+        :param verbose: boolean whether to output the current offset
+        :return: log integrals, one per offset
+        """
+        n_offsets = self.B.shape[1]
+        lincons = [LinearConstraints(self.A, self.B[:, l, None], self.mode, self.dtype) for l in range(n_offsets)]
+        dim = lincons[0].N_dim
+
+        # projections of the standard normal samples are the same for every offset
+        X0_subset = standard_normal(self.rng, (dim, self.n_samples_subset), lincons[0].dtype)
+        AX0_subset = lincons[0].project(X0_subset)
+        X0 = standard_normal(self.rng, (dim, self.n_samples), lincons[0].dtype)
+        AX0 = lincons[0].project(X0)
+
+        shift_sequence, X_init = None, None
+        for l, lincon in enumerate(lincons):
+            warm_started = False
+            if self.warm_start and shift_sequence is not None:
+                shift_sequence, X_init = self._recycle_nestings(lincons[l - 1], lincon, shift_sequence, X_init)
+                warm_started = shift_sequence is not None
+
+            if not warm_started:
+                subset_simulator = SubsetSimulation(lincon, self.n_samples_subset, self.domain_fraction, self.n_skip,
+                                                    rng=self.rng)
+                subset_simulator.run(verbose=False, X0=X0_subset, AX0=AX0_subset)
+                shift_sequence = subset_simulator.tracker.shift_sequence
+                X_init = subset_simulator.tracker.x_inits()
+
+            hdr = HDR(lincon, shift_sequence, self.n_samples, X_init, self.n_skip, rng=self.rng)
+            hdr.run(X0=X0, AX0=AX0)
+            self.tracker.add_integral(hdr.tracker, warm_started)
+
+            if verbose:
+                print('finished offset #{}'.format(l))
+
+        return self.tracker.log_integrals()
+
+    def _recycle_nestings(self, previous_lincon, lincon, shift_sequence, X_init):
+        """
+        Adapt the nestings of the previous offset to the current one. With c = max(b_prev - b), every nesting
+        {A x + b_prev + s >= 0} is contained in {A x + b + s + c >= 0}, hence the starting points remain valid for the
+        shifted sequence. If c > 0, the last shift c is replaced by 0 if the last starting point lies within the domain
+        of interest, such that the sequence does not grow from offset to offset.
+        :param previous_lincon: LinearConstraints of the previous offset
+        :param lincon: LinearConstraints of the current offset
+        :param shift_sequence: shift sequence of the previous offset
+        :param X_init: starting points of the previous offset, shape (D, number of nestings)
+        :return: shift sequence and starting points for the current offset, or (None, None) if they are not valid
+        """
+        c = max(np.amax(previous_lincon.b - lincon.b), 0.)
+        if c == 0.:
+            return shift_sequence, X_init
+
+        if not lincon.integration_domain(X_init[:, -1, None]):
+            return None, None
+        shift_sequence = np.asarray(shift_sequence) + c
+        shift_sequence[-1] = 0.
+        return shift_sequence, X_init
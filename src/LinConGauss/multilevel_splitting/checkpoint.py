@@ -0,0 +1,149 @@
+import glob
+import json
+import os
+
+import numpy as np
+
+
+class Checkpoint():
+    def __init__(self, path, chunk_size=None):
+        """
+        On-disk checkpoint of a multilevel splitting run. The state of the run is kept as a dictionary of arrays
+        together with the state of the random number generator rng of the run, and written to a single .npz file after
+        every completed nesting. Writes are atomic, such that a preempted job always leaves a complete checkpoint.
+        Chunks of a Markov chain in flight are written to files of their own next to it, named after the number of
+        saves of the state (the generation) and the index of the chunk, such that every chunk is written only once.
+        :param path: path of the .npz file
+        :param chunk_size: (optional) if given, Markov chains within a nesting are checkpointed every chunk_size samples,
+        else only completed nestings are
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+        self.state = {}
+        # random number generator whose state is saved, set by the integrator (the global numpy random state if None)
+        self.rng = None
+
+    def exists(self):
+        """ Whether a checkpoint has been written to disk """
+        return os.path.exists(self.path)
+
+    def save(self, **arrays):
+        """
+        Update the state with the given arrays and write it to disk together with the current random state
+        :param arrays: arrays to store, overwriting those with the same name
+        :return: None
+        """
+        self.state.update(arrays)
+        generation = int(self.state.get('generation', 0))
+        self.state['generation'] = generation + 1
+        self._write(self.path, dict(self.state, **self._get_random_state()))
+
+        # chunks of earlier generations are ignored by load, hence a failed removal leaves a valid checkpoint
+        for chunk_path in glob.glob(glob.escape(self.path) + '.chain*.npz'):
+            try:
+                os.remove(chunk_path)
+            except OSError:
+                pass
+
+    def save_chunk(self, index, **arrays):
+        """
+        Write one chunk of the Markov chain in flight to its own file together with the current random state
+        :param index: index of the chunk within the chain
+        :param arrays: arrays of the chunk
+        :return: None
+        """
+        self._write(self._chunk_path(index), dict(arrays, **self._get_random_state()))
+
+    def load(self, restore_random_state=True):
+        """
+        Load the state from disk and restore the random state it was saved with
+        :param restore_random_state: whether to restore the random state into rng, else it can be restored later into
+        any generator of the same type with restore_random_state
+        :return: dictionary of arrays
+        """
+        with np.load(self.path) as data:
+            arrays = {key: data[key] for key in data.files}
+
+        random_keys = ['random_generator', 'random_keys', 'random_pos', 'random_has_gauss', 'random_cached_gaussian']
+        self._random_state = {key: arrays.pop(key) for key in random_keys if key in arrays}
+        self.state = arrays
+
+        # the chunks of a chain in flight continue the saved state, the random state is that of the last chunk
+        chunks = []
+        while os.path.exists(self._chunk_path(len(chunks))):
+            with np.load(self._chunk_path(len(chunks))) as data:
+                chunks.append({key: data[key] for key in data.files})
+        if chunks:
+            self._random_state = {key: chunks[-1][key] for key in random_keys if key in chunks[-1]}
+            self.state.update(chain_x=chunks[-1]['chain_x'], chain_Ax=chunks[-1]['chain_Ax'],
+                              chain_samples=np.hstack([chunk['samples'] for chunk in chunks]),
+                              chain_chunks=len(chunks))
+
+        if restore_random_state:
+            self.restore_random_state()
+        return self.state
+
+    def restore_random_state(self, rng=None):
+        """
+        Restore the random state of the loaded checkpoint
+        :param rng: (optional) random number generator the state was saved from, defaults to self.rng
+        :return: None
+        """
+        if rng is None:
+            rng = np.random if self.rng is None else self.rng
+        state = self._random_state
+        if 'random_generator' in state:
+            rng.bit_generator.state = json.loads(str(state['random_generator']))
+        else:
+            rng.set_state(('MT19937', state['random_keys'], int(state['random_pos']), int(state['random_has_gauss']),
+                           float(state['random_cached_gaussian'])))
+
+    def clear_chain(self):
+        """ Discard the Markov chain in flight, e.g. once its nesting is completed """
+        for key in ['chain_x', 'chain_Ax', 'chain_samples', 'chain_chunks']:
+            self.state.pop(key, None)
+
+    def sample_chain(self, sampler, n_samples):
+        """
+        Continue an EllipticalSliceSampler for n_samples samples and checkpoint the chain every chunk_size samples.
+        Only the new chunk is written (see save_chunk). If the state holds a chain in flight, sampling resumes from
+        its last saved chunk.
+        :param sampler: EllipticalSliceSampler instance
+        :param n_samples: number of samples to draw
+        :return: samples, shape (D, n_samples)
+        """
+        samples = [np.empty((sampler.dim, 0))]
+        n_chunks = 0
+        if 'chain_samples' in self.state:
+            sampler.loop_state.last, sampler.Ax = self.state['chain_x'], self.state['chain_Ax']
+            samples = [self.state['chain_samples']]
+            n_chunks = int(self.state['chain_chunks'])
+
+        n_remaining = n_samples - samples[0].shape[1]
+        for chunk in sampler.iter_samples(n_remaining, self.chunk_size):
+            samples.append(chunk)
+            self.save_chunk(n_chunks, chain_x=sampler.loop_state.last, chain_Ax=sampler.Ax, samples=chunk)
+            n_chunks += 1
+        return np.hstack(samples)
+
+    def _chunk_path(self, index):
+        return '{}.chain{}.{}.npz'.format(self.path, int(self.state.get('generation', 0)), index)
+
+    def _get_random_state(self):
+        """ State of rng (the global numpy random state if None) as a dictionary of arrays """
+        rng = np.random if self.rng is None else self.rng
+        if isinstance(rng, np.random.Generator):
+            return {'random_generator': json.dumps(rng.bit_generator.state)}
+        name, keys, pos, has_gauss, cached_gaussian = rng.get_state()
+        return {'random_keys': keys, 'random_pos': pos, 'random_has_gauss': has_gauss,
+                'random_cached_gaussian': cached_gaussian}
+
+    @staticmethod
+    def _write(path, arrays):
+        """ Write arrays to a .npz file atomically """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
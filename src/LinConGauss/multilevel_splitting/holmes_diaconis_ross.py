@@ -1,50 +1,111 @@
 import numpy as np
 import time
+from concurrent.futures import ProcessPoolExecutor
 
 from .nestings import HDRNesting
+from .. import Instrumentation, ShiftedMargins, get_rng, spawn_rngs
+from ..core.rng import standard_normal
+from ..sampling import EllipticalSliceSampler
 from .integration_tracker import HDRTracker
 from .integration_loop import IntegrationLoop
 
 
 class HDR(IntegrationLoop):
-    def __init__(self, linear_constraints, shift_sequence, n_samples, X_init, n_skip=0, timing=False):
+    def __init__(self, linear_constraints, shift_sequence, n_samples, X_init, n_skip=0, timing=False, n_jobs=1,
+                 instrumentation=None, checkpoint=None, target_error=None, sample_budget=None, recycle=False,
+                 rng=None):
         """
         Holmes-Diaconis-Ross algorithm for estimating integrals of linearly constrained Gaussians
         :param linear_constraints: instance of LinearConstraints
         :param shift_sequence: sequence of numbers > 0 that define the nestings (e.g. shifts from subset simulation)
-        :param n_samples: number of samples per nesting (integer)
+        :param n_samples: number of samples per nesting (integer), the initial number if target_error is given
         :param X_init: starting points for ESS, the ith column has to be in the ith nesting
         :param n_skip: number of samples to skip in ESS
         :param timing: whether to measure the runtime
+        :param n_jobs: number of worker processes the nestings are distributed to (1 runs them serially)
+        :param instrumentation: (optional) Instrumentation instance that records counters per nesting
+        :param checkpoint: (optional) Checkpoint instance the run is saved to after every nesting (and every chunk of
+        the Markov chains if its chunk_size is set and n_jobs=1)
+        :param target_error: (optional) if given, the nestings are extended until the estimated standard error of
+        tracker.log_integral() (to first order the relative standard error of the integral) falls below target_error
+        :param sample_budget: maximum total number of samples over all nestings in the adaptive mode (defaults to 100
+        times the initial number)
+        :param recycle: whether to recycle the samples of every nesting that lie inside the next nesting. These are
+        draws from the next nesting, hence they make up part of its samples and the new samples are drawn by chains
+        that start from them. This reduces the number of ESS steps per integral, but the recycled samples also decided
+        the conditional probability of the previous nesting, hence consecutive conditional probabilities are
+        correlated and tracker.log_integral_standard_error, which assumes independent ones, is not valid.
+        :param rng: (optional) random number generator or seed (see get_rng), defaults to the global numpy random state.
+        Every nesting draws from its own child stream, such that the result does not depend on n_jobs. With recycle or
+        target_error, the nestings depend on each other and all draw from rng.
         """
         super().__init__(linear_constraints, n_samples, n_skip)
 
         self.shift_sequence = shift_sequence
         self.X_init = X_init
         self.tracker = HDRTracker(self.shift_sequence)
+        self.n_jobs = n_jobs
+        self.instrumentation = instrumentation
+        self.tracker.instrumentation = instrumentation
+        self.checkpoint = checkpoint
+        self.rng = get_rng(rng)
+        if self.checkpoint is not None:
+            self.checkpoint.rng = self.rng
+
+        self.target_error = target_error
+        self.sample_budget = sample_budget
+        if self.target_error is not None and (self.n_jobs > 1 or self.checkpoint is not None):
+            raise ValueError('Adaptive sample sizes are only available for serial runs without checkpoint.')
+        self.recycle = recycle
+        if self.recycle and (self.n_jobs > 1 or self.checkpoint is not None or self.target_error is not None):
+            raise ValueError('Recycling samples is only available for serial runs without checkpoint or target error.')
 
         # timing of every iteration in the core
         self.timing = timing
         if self.timing:
             self.times = []
 
-    def run(self, verbose=False):
+    def run(self, verbose=False, X0=None, AX0=None, resume=False):
         """
         Run the HDR method
+        :param verbose: boolean whether to output current nesting number
+        :param X0: (optional) standard normal samples for the first nesting, shape (D, n_samples)
+        :param AX0: (optional) precomputed A @ X0, shape (M, n_samples)
+        :param resume: whether to continue from the checkpoint if one exists. The result is identical to that of an
+        uninterrupted run.
         :return:
         """
-        for i, shift in enumerate(self.shift_sequence):
+        X = self._resume_from_checkpoint() if resume else None
+
+        if self.target_error is not None:
+            return self._run_adaptive(verbose, X0, AX0)
+        if self.n_jobs > 1:
+            return self._run_parallel(verbose, X0, AX0, X)
+
+        recycled = None
+        rngs = None if self.recycle else self._nesting_rngs()[1]
+        for i in range(len(self.tracker.nestings), len(self.shift_sequence)):
             if self.timing:
                 t = time.process_time()
+            if self.instrumentation is not None:
+                self.instrumentation.begin_nesting(index=i)
 
-            if i == 0:
-                X = np.random.randn(self.dim, self.n_samples)
-            else:
-                X = current_nesting.sample_from_nesting(self.n_samples, self.X_init[:, i, None], self.n_skip)
-
-            current_nesting = HDRNesting(self.lincon, shift)
-            current_nesting.compute_log_nesting_factor(X)
+            rng = self.rng if rngs is None else rngs[i]
+            if self.checkpoint is not None:
+                # chunks of the chain are saved with the state of the stream of the nesting
+                self.checkpoint.rng = rng
+                if resume and 'chain_samples' in self.checkpoint.state:
+                    self.checkpoint.restore_random_state(rng)
+            current_nesting, X, margins = _compute_nesting(self.lincon, self.shift_sequence, i, self.n_samples,
+                                                           self.X_init, self.n_skip, X0, AX0, self.instrumentation,
+                                                           self.checkpoint, recycled, rng)
             self.tracker.add_nesting(current_nesting)
+            if self.recycle:
+                recycled = X[:, current_nesting.inside], margins[current_nesting.inside]
+            self._save_checkpoint(X)
+
+            if self.instrumentation is not None:
+                self.instrumentation.end_nesting()
 
             if self.timing:
                 self.times.append(time.process_time() - t)
@@ -61,4 +122,246 @@ class HDR(IntegrationLoop):
         :return: samples (D, n)
         """
         domain = HDRNesting(self.lincon, 0.)
-        return domain.sample_from_nesting(n, self.X_init[:, -1, None], self.n_skip)
\ No newline at end of file
+        return domain.sample_from_nesting(n, self.X_init[:, -1, None], self.n_skip, rng=self.rng)
+
+    def iter_from_domain(self, n, chunk_size=1, sink=None):
+        """
+        Stream samples from the domain of interest without keeping them in memory.
+        :param n: number of samples to draw
+        :param chunk_size: number of samples per chunk
+        :param sink: (optional) object with a write method (e.g. MemmapSampleSink) that receives every chunk
+        :return: generator of samples with shape (D, chunk_size)
+        """
+        domain = HDRNesting(self.lincon, 0.)
+        sampler = EllipticalSliceSampler(0, domain.shifted_lincon, self.n_skip, self.X_init[:, -1, None], rng=self.rng)
+        return sampler.iter_samples(n, chunk_size, sink)
+
+    def _nesting_rngs(self):
+        """
+        Spawn one child stream of self.rng per nesting, or respawn those of the checkpoint the run was resumed from
+        :return: entropy of the child streams and list of Generators
+        """
+        entropy = None
+        if self.checkpoint is not None and 'seed_entropy' in self.checkpoint.state:
+            entropy = self.checkpoint.state['seed_entropy']
+        entropy, rngs = spawn_rngs(self.rng, len(self.shift_sequence), entropy)
+        if self.checkpoint is not None:
+            # stored with the next save, such that a resumed run respawns the same streams
+            self.checkpoint.state['seed_entropy'] = np.asarray(entropy)
+        return entropy, rngs
+
+    def _save_checkpoint(self, X, **arrays):
+        """
+        Save the completed nestings (and the samples of the last nesting once it is completed)
+        :param X: samples of the most recent nesting
+        :param arrays: further arrays to store
+        :return: None
+        """
+        if self.checkpoint is None:
+            return
+        if self.tracker.is_complete():
+            arrays['X'] = X
+        self.checkpoint.clear_chain()
+        self.checkpoint.save(shift_sequence=np.asarray(self.shift_sequence),
+                             log_conditional_probabilities=self.tracker.log_conditional_probabilities,
+                             inside=np.concatenate([nest.inside for nest in self.tracker.nestings]),
+                             n_evaluated=np.asarray([nest.inside.shape[0] for nest in self.tracker.nestings]),
+                             **arrays)
+
+    def _resume_from_checkpoint(self):
+        """
+        Restore the completed nestings from the checkpoint, if it exists. The random state of a chain in flight is
+        restored into the stream of its nesting by run
+        :return: samples of the last nesting if the run was completed, else None
+        """
+        if self.checkpoint is None or not self.checkpoint.exists():
+            return None
+        # the random state belongs to the stream of the nesting in flight and is restored once its stream is spawned
+        state = self.checkpoint.load(restore_random_state=False)
+        if not np.array_equal(state['shift_sequence'], np.asarray(self.shift_sequence)):
+            raise ValueError('The checkpoint was written for a different shift sequence.')
+
+        insides = np.split(state['inside'], np.cumsum(state['n_evaluated'])[:-1])
+        for shift, inside in zip(self.shift_sequence, insides):
+            nesting = HDRNesting(self.lincon, shift)
+            nesting.inside = inside
+            nesting.log_conditional_probability = np.log(inside.sum()) - np.log(inside.shape[0])
+            self.tracker.add_nesting(nesting)
+        return state.get('X')
+
+    def _run_adaptive(self, verbose, X0=None, AX0=None):
+        """
+        Run all nestings with the initial number of samples and extend the chains until the target error is reached or
+        the sample budget is spent. The variance of log p_i is estimated as c_i / N_i with
+        c_i = (1 - p_i) / p_i * tau_i, such that the total variance sum_i c_i / N_i is minimized at a given total
+        number of samples by N_i proportional to sqrt(c_i). Each round, every nesting is extended towards this
+        allocation, but at most doubled, since c_i is only estimated from the samples so far. With timing, self.times
+        holds the process time of every nesting summed over all rounds.
+        :return:
+        """
+        n_nestings = len(self.shift_sequence)
+        budget = 100 * self.n_samples * n_nestings if self.sample_budget is None else self.sample_budget
+        if self.timing:
+            self.times = [0.] * n_nestings
+
+        # chains that sample from the enclosing nesting of every nesting (the first one samples the Gaussian exactly)
+        samplers = [None] + [EllipticalSliceSampler(0, HDRNesting(self.lincon, shift).shifted_lincon, self.n_skip,
+                                                    self.X_init[:, i + 1, None], instrumentation=self.instrumentation,
+                                                    rng=self.rng)
+                             for i, shift in enumerate(self.shift_sequence[:-1])]
+
+        def draw(i, n):
+            if i == 0:
+                return standard_normal(self.rng, (self.dim, n), self.lincon.dtype)
+            return np.hstack(list(samplers[i].iter_samples(n, n)))
+
+        for i, shift in enumerate(self.shift_sequence):
+            t = time.process_time()
+            nesting = HDRNesting(self.lincon, shift)
+            if i == 0 and X0 is not None:
+                X = X0
+                nesting.compute_log_nesting_factor(X0, AX0)
+            else:
+                X = draw(i, self.n_samples)
+                nesting.compute_log_nesting_factor(X)
+            self.tracker.add_nesting(nesting)
+            if self.timing:
+                self.times[i] += time.process_time() - t
+        X_last = [X]
+        n_total = sum(nest.inside.shape[0] for nest in self.tracker.nestings)
+
+        count = 0
+        while self.tracker.log_integral_standard_error() > self.target_error and n_total < budget:
+            n_current = np.asarray([nest.inside.shape[0] for nest in self.tracker.nestings])
+            c = np.asarray([nest.log_variance() for nest in self.tracker.nestings]) * n_current
+
+            # optimal allocation to reach the target error, nestings without samples inside are doubled
+            sqrt_c = np.sqrt(c[np.isfinite(c)])
+            n_target = np.where(np.isfinite(c), np.sqrt(c) * sqrt_c.sum() / self.target_error ** 2, np.inf)
+            n_extend = np.minimum(n_target, 2 * n_current) - n_current
+            n_extend = np.maximum(n_extend, 0).astype(int)
+            n_extend = np.floor(n_extend * min(1., (budget - n_total) / max(n_extend.sum(), 1))).astype(int)
+            if n_extend.sum() == 0:
+                break
+
+            for i, n in enumerate(n_extend):
+                if n > 0:
+                    t = time.process_time()
+                    X = draw(i, n)
+                    self.tracker.nestings[i].add_samples(X)
+                    if self.timing:
+                        self.times[i] += time.process_time() - t
+                    if i == n_nestings - 1:
+                        X_last.append(X)
+            n_total += n_extend.sum()
+
+            count += 1
+            if verbose:
+                print('finished round #{}, standard error {}'.format(count, self.tracker.log_integral_standard_error()))
+
+        self.tracker.nestings[0].set_sample_diagnostics(n_samples=self.tracker.nestings[0].inside.shape[0])
+        for nesting, sampler in zip(self.tracker.nestings[1:], samplers[1:]):
+            nesting.n_skip, nesting.effective_sample_size = sampler.n_skip, sampler.effective_sample_size()
+
+        # saving the samples from the domain of interest
+        X = np.hstack(X_last)
+        self.tracker.add_samples(X[:, self.lincon.integration_domain(X)==1])
+
+    def _run_parallel(self, verbose, X0=None, AX0=None, X=None):
+        """
+        Run the nestings in a pool of worker processes. Nesting i only depends on the ith column of X_init and the
+        shifts, hence all nestings are independent. Every nesting draws from its own child stream of self.rng.
+        :param X: samples of the last nesting if the run was resumed after it completed
+        :return:
+        """
+        n_nestings = len(self.shift_sequence)
+        rngs = self._nesting_rngs()[1]
+        instrumented = self.instrumentation is not None
+        jobs = [(self.lincon, self.shift_sequence, i, self.n_samples, self.X_init, self.n_skip,
+                 X0 if i == 0 else None, AX0 if i == 0 else None, Instrumentation() if instrumented else None,
+                 rngs[i]) for i in range(len(self.tracker.nestings), n_nestings)]
+
+        with ProcessPoolExecutor(max_workers=self.n_jobs) as executor:
+            for job, (nesting, X_last, runtime, instrumentation) in zip(jobs, executor.map(_compute_nesting_seeded,
+                                                                                        jobs)):
+                i = job[2]
+                X = X if X_last is None else X_last
+                self.tracker.add_nesting(nesting)
+                self._save_checkpoint(X)
+                if instrumented:
+                    self.instrumentation.merge(instrumentation)
+
+                if self.timing:
+                    self.times.append(runtime)
+                if verbose:
+                    print('finished nesting #{}'.format(i))
+
+        # saving the samples from the domain of interest
+        self.tracker.add_samples(X[:, self.lincon.integration_domain(X)==1])
+
+
+def _compute_nesting(lincon, shift_sequence, i, n_samples, X_init, n_skip, X0=None, AX0=None, instrumentation=None,
+                     checkpoint=None, recycled=None, rng=None):
+    """
+    Sample from the (i-1)th nesting and compute the conditional probability of the ith nesting. If samples of the
+    (i-1)th nesting are recycled, they make up the first samples and the remaining ones are drawn by chains that start
+    from them.
+    :param lincon: instance of LinearConstraints
+    :param shift_sequence: sequence of shifts that define the nestings
+    :param i: index of the nesting
+    :param n_samples: number of samples per nesting (integer)
+    :param X_init: starting points for ESS, the ith column has to be in the ith nesting
+    :param n_skip: number of samples to skip in ESS
+    :param X0: (optional) standard normal samples for the first nesting, shape (D, n_samples)
+    :param AX0: (optional) precomputed A @ X0, shape (M, n_samples)
+    :param instrumentation: (optional) Instrumentation instance passed on to the sampler
+    :param checkpoint: (optional) Checkpoint instance passed on to the sampler
+    :param recycled: (optional) samples of the (i-1)th nesting and their margins, shapes (D, K) and (K,)
+    :param rng: (optional) random number generator or seed (see get_rng)
+    :return: HDRNesting instance, samples from the (i-1)th nesting and their margins
+    """
+    rng = get_rng(rng)
+    AX, margins = None, None
+    previous_nesting = None
+    if i == 0:
+        X = standard_normal(rng, (lincon.N_dim, n_samples), lincon.dtype) if X0 is None else X0
+        AX = AX0
+    elif recycled is not None and recycled[0].shape[1] > 0:
+        previous_nesting = HDRNesting(lincon, shift_sequence[i - 1])
+        X, margins = recycled[0][:, :n_samples], recycled[1][:n_samples]
+        n_new = n_samples - X.shape[1]
+        if n_new > 0:
+            X_new = previous_nesting.sample_from_nesting_batch(n_new, X[:, :n_new], n_skip, instrumentation, rng)
+            X, margins = np.hstack((X, X_new)), np.concatenate((margins, previous_nesting.margins))
+    else:
+        previous_nesting = HDRNesting(lincon, shift_sequence[i - 1])
+        X = previous_nesting.sample_from_nesting(n_samples, X_init[:, i, None], n_skip, instrumentation, checkpoint,
+                                                 rng)
+        margins = previous_nesting.margins
+
+    margins = ShiftedMargins(lincon, X, AX, margins).margins
+    nesting = HDRNesting(lincon, shift_sequence[i])
+    nesting.compute_log_nesting_factor(X, margins=margins)
+    nesting.set_sample_diagnostics(previous_nesting, X.shape[1])
+    return nesting, X, margins
+
+
+def _compute_nesting_seeded(job):
+    """
+    Worker function for parallel HDR: computes one nesting with its own random stream
+    :param job: arguments of _compute_nesting followed by the Generator of the nesting
+    :return: HDRNesting instance, samples (only for the last nesting, else None), process time of the worker and
+    Instrumentation instance of the worker (or None)
+    """
+    *args, rng = job
+    instrumentation = args[-1]
+
+    t = time.process_time()
+    if instrumentation is not None:
+        instrumentation.begin_nesting(index=args[2])
+    nesting, X, _ = _compute_nesting(*args, rng=rng)
+    if instrumentation is not None:
+        instrumentation.end_nesting()
+
+    is_last = args[2] == len(args[1]) - 1
+    return nesting, X if is_last else None, time.process_time() - t, instrumentation
@@ -0,0 +1,43 @@
+import time
+
+from .. import get_rng
+from .subset_simulation import SubsetSimulation
+from .holmes_diaconis_ross import HDR
+
+
+def integrate(linear_constraints, n_samples, n_samples_subset=64, domain_fraction=0.5, n_skip=0, cache=None,
+              rng=None, **hdr_options):
+    """
+    Integrate a standard normal over the domain of linear constraints with subset simulation followed by HDR. If a
+    cache holds the shift sequence and seed points for the constraints and subset simulation settings, subset
+    simulation is skipped. Note that all integrals computed from one cache entry share its shift sequence, which does
+    not bias HDR but correlates their nestings.
+    :param linear_constraints: instance of LinearConstraints
+    :param n_samples: number of samples per nesting in HDR (integer)
+    :param n_samples_subset: number of samples per nesting in subset simulation (integer)
+    :param domain_fraction: fraction of samples that should lie in each new subset (between 0 and 1)
+    :param n_skip: number of samples to skip in ESS
+    :param cache: (optional) ShiftSequenceCache instance that is consulted and updated
+    :param rng: (optional) random number generator or seed (see get_rng)
+    :param hdr_options: further keyword arguments of HDR (e.g. n_jobs, recycle)
+    :return: HDR instance that ran, whether the shift sequence came from the cache, the runtime of subset simulation
+    (or of the cache lookup) and the runtime of HDR in seconds
+    """
+    rng = get_rng(rng)
+    t = time.perf_counter()
+
+    key = None if cache is None else cache.key(linear_constraints, domain_fraction, n_samples_subset)
+    cached = None if key is None else cache.get(key)
+    if cached is None:
+        subset_simulator = SubsetSimulation(linear_constraints, n_samples_subset, domain_fraction, n_skip, rng=rng)
+        subset_simulator.run(verbose=False)
+        shift_sequence, x_inits = subset_simulator.tracker.shift_sequence, subset_simulator.tracker.x_inits()
+        if key is not None:
+            cache.put(key, shift_sequence, x_inits)
+    else:
+        shift_sequence, x_inits = cached
+    t_subset = time.perf_counter() - t
+
+    hdr = HDR(linear_constraints, shift_sequence, n_samples, x_inits, n_skip, rng=rng, **hdr_options)
+    hdr.run()
+    return hdr, cached is not None, t_subset, time.perf_counter() - t - t_subset
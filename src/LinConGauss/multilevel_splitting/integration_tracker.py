@@ -7,6 +7,8 @@ class IntegratorState(LoopState):
     def __init__(self):
         super().__init__()
         self.nestings = []
+        # optional Instrumentation instance of the integration loop
+        self.instrumentation = None
 
     def add_nesting(self, new_nesting):
         """
@@ -26,6 +28,25 @@ class IntegratorState(LoopState):
     def integral(self):
         return self.conditional_probabilities.prod()
 
+    def export_metrics(self):
+        """
+        Counters and timers recorded by the instrumentation, with shift, conditional probability and (if recorded)
+        n_skip and effective sample size of every nesting
+        :return: dictionary with totals and a list of per-nesting records
+        """
+        if self.instrumentation is None:
+            metrics = {'totals': {}, 'nestings': [{} for _ in self.nestings]}
+        else:
+            metrics = self.instrumentation.to_dict()
+
+        for record, nest in zip(metrics['nestings'], self.nestings):
+            record['shift'] = float(nest.shift)
+            record['log_conditional_probability'] = float(nest.log_conditional_probability)
+            if nest.effective_sample_size is not None:
+                record['n_skip'] = int(nest.n_skip)
+                record['effective_sample_size'] = float(nest.effective_sample_size)
+        return metrics
+
     def log_integral(self):
         return self.log_conditional_probabilities.sum()
 
@@ -64,6 +85,15 @@ class HDRTracker(IntegratorState):
         self.X = X
         return
 
+    def log_integral_standard_error(self):
+        """
+        Estimated standard error of log_integral, which to first order is the relative standard error of the integral.
+        The conditional probabilities are treated as independent, since every nesting is sampled by its own chain. This
+        does not hold if HDR recycles samples, which correlates consecutive conditional probabilities.
+        :return: standard error
+        """
+        return np.sqrt(sum(nest.log_variance() for nest in self.nestings))
+
 
 class SubsetSimulationTracker(IntegratorState):
     def __init__(self):
@@ -94,4 +124,44 @@ class SubsetSimulationTracker(IntegratorState):
 
     def x_inits(self):
         """ Initial locations needed for sampling from the nestings """
-        return np.hstack([nest.x_in for nest in self.nestings])
\ No newline at end of file
+        return np.hstack([nest.x_in for nest in self.nestings])
+
+class BatchIntegrationTracker(LoopState):
+    def __init__(self):
+        """ Track record of a batch of HDR integrations that share one constraint matrix """
+        super().__init__()
+        self.trackers = []
+        self.warm_started = []
+
+    def add_integral(self, tracker, warm_started):
+        """
+        Add the result of one integration to the batch
+        :param tracker: HDRTracker of the integration
+        :param warm_started: whether the shift sequence was recycled from the previous offset
+        :return: None
+        """
+        self.trackers.append(tracker)
+        self.warm_started.append(warm_started)
+
+    def log_integrals(self):
+        """
+        :return: log integrals, one per offset
+        """
+        return np.asarray([tracker.log_integral() for tracker in self.trackers])
+
+    def integrals(self):
+        """
+        :return: integrals, one per offset
+        """
+        return np.exp(self.log_integrals())
+
+    def diagnostics(self):
+        """
+        Per-offset diagnostics
+        :return: list of dictionaries with number of nestings, shift sequence, conditional probabilities and whether
+        the integration was warm-started
+        """
+        return [{'n_nestings': len(tracker.nestings),
+                 'shift_sequence': np.asarray(tracker.shift_sequence),
+                 'conditional_probabilities': tracker.conditional_probabilities,
+                 'warm_started': warm_started} for tracker, warm_started in zip(self.trackers, self.warm_started)]
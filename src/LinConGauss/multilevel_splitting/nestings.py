@@ -1,21 +1,49 @@
 import numpy as np
 
-from .. import ShiftedLinearConstraints
-from ..sampling import EllipticalSliceSampler
+from .. import ShiftedLinearConstraints, ShiftedMargins, get_rng
+from ..sampling import EllipticalSliceSampler, BatchEllipticalSliceSampler, integrated_autocorrelation_time
 
 class Nesting():
     def __init__(self):
         """
         Base class for an individual nesting in a multilevel splitting method
         """
-        pass
+        # n_skip and effective sample size of the samples the log conditional probability was computed from
+        self.n_skip = None
+        self.effective_sample_size = None
 
-    def sample_from_nesting(self, n_samples, x_init, n_skip):
+        # n_skip and effective sample size of the last chain that sampled from this nesting
+        self.chain_n_skip = None
+        self.chain_effective_sample_size = None
+        # margins (see margin_from_evaluation, without shift) of the samples last drawn from this nesting, if recorded
+        self.margins = None
+
+    def set_sample_diagnostics(self, enclosing_nesting=None, n_samples=None):
+        """
+        Record n_skip and effective sample size of the samples the log conditional probability was computed from
+        :param enclosing_nesting: nesting whose chain produced the samples, None for independent samples
+        :param n_samples: number of independent samples if enclosing_nesting is None
+        :return: None
+        """
+        if enclosing_nesting is None:
+            self.n_skip, self.effective_sample_size = 0, float(n_samples)
+        else:
+            self.n_skip = enclosing_nesting.chain_n_skip
+            self.effective_sample_size = enclosing_nesting.chain_effective_sample_size
+
+    def _record_chain(self, sampler):
+        """ Keep n_skip and effective sample size of a chain that sampled from this nesting """
+        self.chain_n_skip = sampler.n_skip
+        self.chain_effective_sample_size = sampler.effective_sample_size()
+
+    def sample_from_nesting(self, n_samples, x_init, n_skip, instrumentation=None, rng=None):
         """
         Draw samples from the nesting using LIN-ESS
         :param n_samples: number of samples to draw
         :param x_init: Starting point in domain
         :param n_skip: number of samples to skip in Markov chain
+        :param instrumentation: (optional) Instrumentation instance passed on to the sampler
+        :param rng: (optional) random number generator or seed passed on to the sampler
         :return: samples
         """
         return NotImplementedError
@@ -23,6 +51,25 @@ class Nesting():
     def compute_log_nesting_factor(self, X):
         return NotImplementedError
 
+    def sample_from_nesting_batch(self, n_samples, X_init, n_skip, instrumentation=None, rng=None):
+        """
+        Draw samples from the nesting using many short LIN-ESS chains that are advanced in lockstep
+        :param n_samples: number of samples to draw
+        :param X_init: Starting points in domain, one per chain, shape (D, K)
+        :param n_skip: number of samples to skip in Markov chains
+        :param instrumentation: (optional) Instrumentation instance passed on to the sampler
+        :param rng: (optional) random number generator or seed passed on to the sampler
+        :return: samples (D, n_samples), excluding the starting points
+        """
+        n_chains = X_init.shape[1]
+        n_iterations = -(-n_samples // n_chains)
+        sampler = BatchEllipticalSliceSampler(n_iterations, self.shifted_lincon, n_skip, X_init,
+                                              instrumentation=instrumentation, rng=rng)
+        sampler.run()
+        self._record_chain(sampler)
+        self.margins = sampler.loop_state.margins[n_chains:n_chains + n_samples] - self.shift
+        return sampler.loop_state.X[:, n_chains:n_chains + n_samples]
+
 
 class HDRNesting(Nesting):
     def __init__(self, linear_constraints, shift):
@@ -31,28 +78,85 @@ class HDRNesting(Nesting):
         :param linear_constraints: instance of linear constraints
         :param shift: shift defining the nesting
         """
-        self.shifted_lincon = ShiftedLinearConstraints(linear_constraints.A, linear_constraints.b, shift)
+        self.lincon = linear_constraints
         self.shift = shift
-        self.dim = self.shifted_lincon.N_dim
+        self.dim = self.lincon.N_dim
+        self._shifted_lincon = None
         self.log_conditional_probability = None
+        # indicators of the samples from the enclosing nesting that lie in this nesting, in chain order
+        self.inside = None
 
         super().__init__()
 
-    def sample_from_nesting(self, n_samples, x_init, n_skip):
+    @property
+    def shifted_lincon(self):
+        """ Shifted linear constraints of the nesting, only built when the nesting is sampled from """
+        if self._shifted_lincon is None:
+            self._shifted_lincon = ShiftedLinearConstraints(self.lincon.A, self.lincon.b, self.shift, self.lincon.dtype,
+                                                            self.lincon.block_size, self.lincon.mode)
+        return self._shifted_lincon
+
+    def sample_from_nesting(self, n_samples, x_init, n_skip, instrumentation=None, checkpoint=None, rng=None):
         """
-        Draw samples from the nesting using LIN-ESS
+        Draw samples from the nesting using LIN-ESS. The margins of the samples are kept in self.margins, unless the
+        chain is checkpointed.
         :param n_samples: number of samples to draw
         :param x_init: Starting point in domain
         :param n_skip: number of samples to skip in Markov chain
+        :param instrumentation: (optional) Instrumentation instance passed on to the sampler
+        :param checkpoint: (optional) Checkpoint instance with a chunk_size that the chain is saved to
+        :param rng: (optional) random number generator or seed passed on to the sampler
         :return: samples
         """
         # sample from new domain using the elliptical slice sampler
-        sampler = EllipticalSliceSampler(n_samples, self.shifted_lincon, n_skip, x_init)
-        sampler.run()
-        return sampler.loop_state.X
+        sampler = EllipticalSliceSampler(n_samples, self.shifted_lincon, n_skip, x_init,
+                                         instrumentation=instrumentation, rng=rng)
+        self.margins = None
+        if checkpoint is not None and checkpoint.chunk_size is not None:
+            X = np.hstack((x_init, checkpoint.sample_chain(sampler, n_samples)))
+        else:
+            sampler.run()
+            X = sampler.loop_state.X
+            self.margins = sampler.loop_state.margins - self.shift
+        self._record_chain(sampler)
+        return X
 
-    def compute_log_nesting_factor(self, X):
-        self.log_conditional_probability = np.log(self.shifted_lincon.integration_domain(X).sum()) - np.log(X.shape[1])
+    def compute_log_nesting_factor(self, X, AX=None, margins=None):
+        """
+        Compute the log conditional probability of the nesting from samples of the enclosing nesting
+        :param X: samples, shape (D, N)
+        :param AX: (optional) precomputed A @ X, shape (M, N)
+        :param margins: (optional) margins of the samples, min_m (Ax + b)_m or max_m (Ax + b)_m depending on the mode
+        (see margin_from_evaluation), e.g. recorded by the sampler, shape (N,)
+        :return: None
+        """
+        self.inside = None
+        self.add_samples(X, AX, margins)
+
+    def add_samples(self, X, AX=None, margins=None):
+        """
+        Update the log conditional probability with further samples of the enclosing nesting that continue its chain
+        :param X: samples, shape (D, N)
+        :param AX: (optional) precomputed A @ X, shape (M, N)
+        :param margins: (optional) margins of the samples, min_m (Ax + b)_m or max_m (Ax + b)_m depending on the mode
+        (see margin_from_evaluation), shape (N,)
+        :return: None
+        """
+        inside = ShiftedMargins(self.lincon, X, AX, margins).integration_domain(self.shift).astype(bool)
+        self.inside = inside if self.inside is None else np.concatenate((self.inside, inside))
+        self.log_conditional_probability = np.log(self.inside.sum()) - np.log(self.inside.shape[0])
+
+    def log_variance(self):
+        """
+        Estimate the variance of the log conditional probability from the samples of the enclosing nesting,
+        Var[log p] = (1 - p) / (p N) * tau, where tau is the integrated autocorrelation time of the indicators
+        :return: variance (inf if no sample lies in the nesting)
+        """
+        n = self.inside.shape[0]
+        p = self.inside.sum() / n
+        if p == 0.:
+            return np.inf
+        return (1. - p) / (p * n) * integrated_autocorrelation_time(self.inside)
 
 
 class SubsetNesting(Nesting):
@@ -63,7 +167,7 @@ class SubsetNesting(Nesting):
         HDRNesting, which is pre-constructed given shift values.
         :param fraction: Fraction of samples that should lie in the new domain
         :param linear_constraints: instance of LinearConstraints
-        :param n_save: number of samples to save from inside the domain
+        :param n_save: number of samples to save from inside the domain (None saves all of them)
         """
 
         self.fraction = fraction
@@ -75,14 +179,19 @@ class SubsetNesting(Nesting):
         self.log_conditional_probability = None
         self.shift = None
         self.x_in = None
+        self.X_in = None
         self.shifted_lincon = None
 
         super().__init__()
 
-    def update_properties_from_samples(self, X):
+    def update_properties_from_samples(self, X, AX=None, margins=None, rng=None):
         """
-        Computes the shift from samples and one sample within the domain
+        Computes the shift from samples and n_save samples within the domain
         :param X: Samples with shape (D, N)
+        :param AX: (optional) precomputed A @ X, shape (M, N)
+        :param margins: (optional) margins of the samples, min_m (Ax + b)_m or max_m (Ax + b)_m depending on the mode
+        (see margin_from_evaluation), e.g. recorded by the sampler, shape (N,)
+        :param rng: (optional) random number generator or seed (see get_rng) that picks the saved samples
         :return: None
         """
         self.n_inside = np.int(X.shape[-1] * self.fraction)
@@ -90,7 +199,7 @@ class SubsetNesting(Nesting):
         # Update log conditional probability
         self.compute_log_nesting_factor(X)
 
-        shiftvals = -np.amin(self.lincon.evaluate(X), axis=0)
+        shiftvals = -ShiftedMargins(self.lincon, X, AX, margins).margins
 
         # pre-compute shift and index set
         if (shiftvals < 0).sum() > self.n_inside:
@@ -100,26 +209,41 @@ class SubsetNesting(Nesting):
         else:
             self.shift, idx_inside = self._update_find_shift(shiftvals)
 
-        self.x_in = X[:, np.random.choice(idx_inside, size=self.n_save)].reshape(-1, 1)
-        self.shifted_lincon = ShiftedLinearConstraints(self.lincon.A, self.lincon.b, self.shift)
+        if self.n_save is None:
+            self.X_in = X[:, idx_inside]
+        else:
+            self.X_in = X[:, get_rng(rng).choice(idx_inside, size=self.n_save)]
+        self.x_in = self.X_in[:, 0:1]
+        self.shifted_lincon = ShiftedLinearConstraints(self.lincon.A, self.lincon.b, self.shift, self.lincon.dtype,
+                                                       self.lincon.block_size, self.lincon.mode)
         return
 
     def compute_log_nesting_factor(self, X):
         self.log_conditional_probability = np.log(np.int(X.shape[1] * self.fraction)) - np.log(X.shape[1])
 
-    def sample_from_nesting(self, n, x_init, n_skip):
+    def sample_from_nesting(self, n, x_init, n_skip, instrumentation=None, checkpoint=None, rng=None):
         """
         Draw samples from the nesting using LIN-ESS
         :param n: number of samples to draw
         :param x_init: Starting point in domain
         :param n_skip: number of samples to skip in Markov chain
+        :param instrumentation: (optional) Instrumentation instance passed on to the sampler
+        :param checkpoint: (optional) Checkpoint instance with a chunk_size that the chain is saved to
+        :param rng: (optional) random number generator or seed passed on to the sampler
         :return: samples
         """
         # sample from new domain using the elliptical slice sampler
-        sampler = EllipticalSliceSampler(n, self.shifted_lincon, n_skip, x_init)
-        sampler.run()
-        n_init = x_init.shape[1]
-        return sampler.loop_state.X[:, n_init:]
+        sampler = EllipticalSliceSampler(n, self.shifted_lincon, n_skip, x_init, instrumentation=instrumentation,
+                                         rng=rng)
+        self.margins = None
+        if checkpoint is not None and checkpoint.chunk_size is not None:
+            X = checkpoint.sample_chain(sampler, n)
+        else:
+            sampler.run()
+            X = sampler.loop_state.X[:, x_init.shape[1]:]
+            self.margins = sampler.loop_state.margins[x_init.shape[1]:] - self.shift
+        self._record_chain(sampler)
+        return X
 
     def _update_find_shift(self, shiftvals):
         """
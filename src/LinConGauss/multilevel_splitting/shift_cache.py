@@ -0,0 +1,109 @@
+import glob
+import hashlib
+import os
+
+import numpy as np
+
+
+def constraint_hash(linear_constraints, *parameters):
+    """
+    Content hash of linear constraints and further parameters (e.g. settings of subset simulation). Dense and
+    memory-mapped matrices are hashed in blocks of rows, sparse matrices by their CSR arrays and linear operators by
+    their materialized matrix.
+    :param linear_constraints: instance of LinearConstraints
+    :param parameters: further parameters that are part of the key, their str representation is hashed
+    :return: hex digest
+    """
+    A = linear_constraints.A
+    h = hashlib.sha1(str((A.shape, linear_constraints.mode, linear_constraints.dtype.str) + parameters).encode())
+    if hasattr(A, 'tocsr'):
+        A = A.tocsr()
+        for array in (A.data, A.indices, A.indptr):
+            h.update(np.ascontiguousarray(array).tobytes())
+    else:
+        if not isinstance(A, np.ndarray):
+            A = linear_constraints.dense_matrix()
+        rows = max(linear_constraints.block_size // max(A.shape[1], 1), 1)
+        for start in range(0, A.shape[0], rows):
+            h.update(np.ascontiguousarray(A[start:start + rows], dtype=linear_constraints.dtype).tobytes())
+    h.update(np.ascontiguousarray(linear_constraints.b, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+class ShiftSequenceCache():
+    def __init__(self, directory, max_bytes=2**30):
+        """
+        On-disk cache of shift sequences and seed points of subset simulation, such that repeated integrals over the
+        same domain skip subset simulation. Every entry is a .npz file named after its key. Entries are evicted in
+        least recently used order (by modification time, which is updated on every hit) once the files exceed
+        max_bytes in total. Writes are atomic, such that several processes can share a cache directory.
+        :param directory: directory of the cache, created if it does not exist
+        :param max_bytes: maximum total size of the cache files
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, linear_constraints, domain_fraction, n_samples):
+        """
+        Key of the shift sequence of subset simulation for the given constraints and settings
+        :param linear_constraints: instance of LinearConstraints
+        :param domain_fraction: fraction of samples that lie in each new nesting
+        :param n_samples: number of samples per nesting
+        :return: key
+        """
+        return constraint_hash(linear_constraints, float(domain_fraction), int(n_samples))
+
+    def get(self, key):
+        """
+        Look up an entry and mark it as recently used
+        :param key: key of the entry
+        :return: shift sequence and seed points (D, number of nestings), or None if there is no entry
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                shift_sequence, x_inits = data['shift_sequence'], data['x_inits']
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            # missing, evicted by another process or incomplete
+            return None
+        return shift_sequence, x_inits
+
+    def put(self, key, shift_sequence, x_inits):
+        """
+        Store an entry and evict the least recently used entries beyond max_bytes
+        :param key: key of the entry
+        :param shift_sequence: shift sequence, shape (L,)
+        :param x_inits: seed points of the nestings, shape (D, L)
+        :return: None
+        """
+        path = self._path(key)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, shift_sequence=np.asarray(shift_sequence), x_inits=x_inits)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def _evict(self):
+        """ Remove the least recently used entries until the cache fits into max_bytes """
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, '*.npz')):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
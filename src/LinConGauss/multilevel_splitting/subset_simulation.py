@@ -1,11 +1,14 @@
 import numpy as np
 import time
+from .. import ShiftedLinearConstraints, get_rng
+from ..core.rng import standard_normal
 from .nestings import SubsetNesting
 from .integration_tracker import SubsetSimulationTracker
 from .integration_loop import IntegrationLoop
 
 class SubsetSimulation(IntegrationLoop):
-    def __init__(self, linear_constraints, n_samples, domain_fraction, n_skip=0, timing=False):
+    def __init__(self, linear_constraints, n_samples, domain_fraction, n_skip=0, timing=False, population=False,
+                 instrumentation=None, checkpoint=None, rng=None):
         """
         Subset simulation to find a linearly constrained probability of failure in a Gaussian space
         :param linear_constraints: instance of LinearConstraints
@@ -13,46 +16,130 @@ class SubsetSimulation(IntegrationLoop):
         :param domain_fraction: fraction of samples that should lie in the new domain (between 0 and 1)
         :param n_skip: number of samples to skip in ESS to get more independent samples
         :param timing: whether to measure and record core runtime
+        :param population: if True, every sample inside a nesting seeds a short Markov chain and the chains are run
+        as one batch, else a single long chain is grown from one seed
+        :param instrumentation: (optional) Instrumentation instance that records counters per nesting
+        :param checkpoint: (optional) Checkpoint instance the run is saved to after every nesting (and every chunk of
+        the Markov chain if its chunk_size is set and population=False)
+        :param rng: (optional) random number generator or seed (see get_rng), defaults to the global numpy random state
         """
         super().__init__(linear_constraints, n_samples, n_skip)
 
         self.domain_fraction = domain_fraction
+        self.population = population
+        self.n_save = None if self.population else 1
 
         # keep track of subset simulation
         self.tracker = SubsetSimulationTracker()
+        self.instrumentation = instrumentation
+        self.tracker.instrumentation = instrumentation
+        self.checkpoint = checkpoint
+        self.rng = get_rng(rng)
+        if self.checkpoint is not None:
+            self.checkpoint.rng = self.rng
 
         # timing of every iteration in the core
         self.timing = timing
         if self.timing:
             self.times = []
 
-    def run(self, verbose=True):
+    def run(self, verbose=True, X0=None, AX0=None, resume=False):
         """
         Run the subset sampling core
         :param time: boolean whether to measure the time
         :param verbose: boolean whether to output current nesting number
+        :param X0: (optional) standard normal samples for the first nesting, shape (D, n_samples)
+        :param AX0: (optional) precomputed A @ X0, shape (M, n_samples)
+        :param resume: whether to continue from the checkpoint if one exists. The result is identical to that of an
+        uninterrupted run.
         :return:
         """
-        X = np.random.randn(self.dim, self.n_samples)
-        subdomain = SubsetNesting(self.lincon, self.domain_fraction)
-        subdomain.update_properties_from_samples(X)
-        self.tracker.add_nesting(subdomain)
+        subdomain = self._resume_from_checkpoint() if resume else None
 
-        count = 0
+        if subdomain is None:
+            if self.instrumentation is not None:
+                self.instrumentation.begin_nesting(index=0)
+
+            if X0 is None:
+                X = standard_normal(self.rng, (self.dim, self.n_samples), self.lincon.dtype)
+            else:
+                X = X0
+            subdomain = SubsetNesting(self.lincon, self.domain_fraction, self.n_save)
+            subdomain.update_properties_from_samples(X, AX0, rng=self.rng)
+            subdomain.set_sample_diagnostics(n_samples=X.shape[1])
+            self.tracker.add_nesting(subdomain)
+            self._save_checkpoint()
+
+            if self.instrumentation is not None:
+                self.instrumentation.end_nesting()
+
+        count = self.tracker.n_nestings() - 1
         while not self.tracker.is_complete():
             count += 1
             if self.timing:
                 t = time.process_time()
+            if self.instrumentation is not None:
+                self.instrumentation.begin_nesting(index=count)
 
             # sample from new domain using the elliptical slice sampler
-            X = subdomain.sample_from_nesting(self.n_samples, subdomain.x_in, self.n_skip)
+            if self.population:
+                X = subdomain.sample_from_nesting_batch(self.n_samples, subdomain.X_in, self.n_skip,
+                                                        self.instrumentation, self.rng)
+            else:
+                X = subdomain.sample_from_nesting(self.n_samples, subdomain.x_in, self.n_skip, self.instrumentation,
+                                                  self.checkpoint, self.rng)
 
             # create new nesting and add it to records
-            subdomain = SubsetNesting(self.lincon, self.domain_fraction)
-            subdomain.update_properties_from_samples(X)
+            enclosing_subdomain = subdomain
+            subdomain = SubsetNesting(self.lincon, self.domain_fraction, self.n_save)
+            subdomain.update_properties_from_samples(X, margins=enclosing_subdomain.margins, rng=self.rng)
+            subdomain.set_sample_diagnostics(enclosing_subdomain)
             self.tracker.add_nesting(subdomain)
+            self._save_checkpoint()
+
+            if self.instrumentation is not None:
+                self.instrumentation.end_nesting()
 
             if self.timing:
                 self.times.append(time.process_time()-t)
             if verbose:
-                print('finished nesting #{}'.format(count))
\ No newline at end of file
+                print('finished nesting #{}'.format(count))
+
+    def _save_checkpoint(self):
+        """
+        Save shift, conditional probability and seed of every nesting, and all seeds of the most recent nesting
+        :return: None
+        """
+        if self.checkpoint is None:
+            return
+        nestings = self.tracker.nestings
+        self.checkpoint.clear_chain()
+        self.checkpoint.save(shift_sequence=self.tracker.shift_sequence,
+                             log_conditional_probabilities=self.tracker.log_conditional_probabilities,
+                             n_inside=np.asarray([nest.n_inside for nest in nestings]),
+                             x_inits=self.tracker.x_inits(), X_in=nestings[-1].X_in)
+
+    def _resume_from_checkpoint(self):
+        """
+        Restore the nestings and the random state from the checkpoint, if it exists. Only the most recent nesting
+        keeps all its seeds, the others keep x_in.
+        :return: the most recent nesting, or None if there is no checkpoint
+        """
+        if self.checkpoint is None or not self.checkpoint.exists():
+            return None
+        state = self.checkpoint.load()
+
+        for i, shift in enumerate(state['shift_sequence']):
+            nesting = SubsetNesting(self.lincon, self.domain_fraction, self.n_save)
+            nesting.shift = shift
+            nesting.log_conditional_probability = state['log_conditional_probabilities'][i]
+            nesting.n_inside = state['n_inside'][i]
+            nesting.X_in = state['x_inits'][:, i, None]
+            nesting.x_in = nesting.X_in
+            nesting.shifted_lincon = ShiftedLinearConstraints(self.lincon.A, self.lincon.b, shift, self.lincon.dtype,
+                                                              self.lincon.block_size, self.lincon.mode)
+            self.tracker.add_nesting(nesting)
+
+        nesting.X_in = state['X_in']
+        nesting.x_in = nesting.X_in[:, 0:1]
+        return nesting
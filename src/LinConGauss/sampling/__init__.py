@@ -1,6 +1,8 @@
-from .active_intersections import ActiveIntersections
-from .angle_sampler import AngleSampler
+from .active_intersections import ActiveIntersections, BatchActiveIntersections
+from .angle_sampler import AngleSampler, BatchAngleSampler
 from .ellipse import Ellipse
 from .elliptical_slice_sampling import EllipticalSliceSampler
+from .batch_elliptical_slice_sampling import BatchEllipticalSliceSampler
 from .sampling_loop import SamplingLoop
-
+from .sample_sink import MemmapSampleSink
+from .autocorrelation import integrated_autocorrelation_time, StreamingAutocorrelation
@@ -2,62 +2,48 @@ import numpy as np
 
 
 class ActiveIntersections():
-    def __init__(self, ellipse, linear_constraints):
+    def __init__(self, ellipse, linear_constraints, g1=None, g2=None):
         """
         compute the intersections between an ellipse and M linear constraints
         and find those intersections that are on the boundary of the integration domain.
         :param ellipse: Ellipse instance
         :param linear_constraints: LinearConstraints instance
+        :param g1: (optional) precomputed A @ a1, shape (M, 1)
+        :param g2: (optional) precomputed A @ a2, shape (M, 1)
         """
         self.ellipse = ellipse
         self.lincon = linear_constraints
         self.N_constraints = self.lincon.b.shape[0]
         self.ellipse_in_domain = True
+        self.n_intersections = None
+
+        self.g1 = self.lincon.project(self.ellipse.a1) if g1 is None else g1
+        self.g2 = self.lincon.project(self.ellipse.a2) if g2 is None else g2
 
     def intersection_angles(self):
         """ Compute all of the up to 2M intersections of the ellipse and the linear constraints """
-        g1 = np.dot(self.lincon.A, self.ellipse.a1)
-        g2 = np.dot(self.lincon.A, self.ellipse.a2)
-
-        r = np.sqrt(g1**2 + g2**2)
-        phi = 2*np.arctan(g2/(r+g1)).squeeze()
-
-        # two solutions per linear constraint, shape of theta: (M, 2)
-        arg = - (self.lincon.b / r).squeeze()
-        theta = np.zeros((self.N_constraints, 2))
-
-        # write NaNs if there is no intersection
-        arg = np.where(np.absolute(arg) <= 1, arg, np.nan)
-        theta[:, 0] = np.arccos(arg) + phi
-        theta[:, 1] = - np.arccos(arg) + phi
-        theta = theta[np.isfinite(theta)]
-
-        return np.sort(theta + (theta < 0.)*2.*np.pi)   # in [0, 2*pi]
+        theta, directions, _ = self._intersections()
+        return theta[directions != 0]   # in [0, 2*pi]
 
     def find_active_intersections(self):
         """
-        Find angles of those intersections that are at the boundary of the integration domain
-        by adding and subtracting a small angle and evaluating on the ellipse to see if we are on the boundary of the
-        integration domain.
+        Find angles of those intersections that are at the boundary of the integration domain.
+        Every intersection either enters or leaves the half-space of its constraint, which is known in closed form,
+        hence a single sweep over the sorted angles yields the number of satisfied constraints between any two
+        consecutive intersections and with it the boundary of the integration domain.
         :return: angles of active intersection in order of increasing angle theta such that activation happens in
         positive direction. If a slice crosses theta=0, the first angle is appended at the end of the array.
         Every row of the returned array defines a slice for elliptical slice sampling.
         """
-        delta_theta = 1.e-10 * 2.*np.pi
-        theta = self.intersection_angles()
+        theta, directions, n_satisfied_at_zero = self._intersections()
+        self.n_intersections = np.count_nonzero(directions)
 
-        active_directions = self._index_active(theta, delta_theta)
+        active_directions = self._index_active(directions, n_satisfied_at_zero)
         theta_active = theta[np.nonzero(active_directions)]
 
-        while theta_active.size % 2 == 1:
-            # Almost tangential ellipses, reduce delta_theta
-            delta_theta = 1.e-1 * delta_theta
-            active_directions = self._index_active(theta, delta_theta)
-            theta_active = theta[np.nonzero(active_directions)]
-
         if not theta_active.size:
             theta_active = np.asarray([0, 2*np.pi])
-            if not self.lincon.integration_domain(self.ellipse.x(2 * np.pi * np.random.rand())):
+            if not _domain_from_count(n_satisfied_at_zero, self.N_constraints, self.lincon.mode):
                 # entire ellipse is outside of the domain
                 self.ellipse_in_domain = False
         else:
@@ -78,18 +64,132 @@ class ActiveIntersections():
 
         return rotation_angle, slices + (slices < 0)*2.*np.pi
 
-    def _index_active(self, t, dt):
+    def _intersections(self):
+        """
+        Sorted intersection angles and the change in the number of satisfied constraints at each of them
+        :return: angles in [0, 2*pi], shape (2M,), directions, shape (2M,), number of constraints satisfied at theta=0
+        """
+        theta, directions, n_satisfied_at_zero = _intersection_angles(self.g1, self.g2, self.lincon.b)
+        return theta.squeeze(axis=1), directions.squeeze(axis=1), n_satisfied_at_zero[0]
+
+    def _index_active(self, directions, n_satisfied_at_zero):
         """
         Compute indices of angles on the ellipse that are on the boundary of the integration domain
-        :param t: angle theta, shape (2M,)
-        :param dt: infinitesimal angle delta_theta (integer)
-        :return: indices where result is non-zero
+        :param directions: change in the number of satisfied constraints at the sorted angles, shape (2M,)
+        :param n_satisfied_at_zero: number of constraints satisfied at theta=0
+        :return: +1 where the domain is entered, -1 where it is left, 0 elsewhere, shape (2M,)
         """
-        idx = np.zeros_like(t)
-        idx[:] = self.lincon.integration_domain(self.ellipse.x(t + dt)) - \
-                 self.lincon.integration_domain(self.ellipse.x(t - dt))
+        n_satisfied = n_satisfied_at_zero + np.append(0, directions.cumsum())
+        in_domain = _domain_from_count(n_satisfied, self.N_constraints, self.lincon.mode).astype(int)
+
+        return np.diff(in_domain)
+
 
-        return idx
+class BatchActiveIntersections():
+    def __init__(self, ellipse, linear_constraints, g1=None, g2=None):
+        """
+        Active intersections for K ellipses at once (one per Markov chain). The boundary of the integration domain is
+        found in closed form: every intersection angle either enters or leaves the half-space of its constraint, so a
+        single sweep over the sorted angles gives the number of satisfied constraints on every arc of the ellipse.
+        :param ellipse: Ellipse instance with a1, a2 of shape (D, K)
+        :param linear_constraints: LinearConstraints instance
+        :param g1: (optional) precomputed A @ a1, shape (M, K)
+        :param g2: (optional) precomputed A @ a2, shape (M, K)
+        """
+        self.ellipse = ellipse
+        self.lincon = linear_constraints
+        self.N_constraints = self.lincon.b.shape[0]
+        self.n_intersections = None
 
+        self.g1 = self.lincon.project(self.ellipse.a1) if g1 is None else g1
+        self.g2 = self.lincon.project(self.ellipse.a2) if g2 is None else g2
 
+    def intersection_angles(self):
+        """
+        Compute all of the up to 2M intersections of the K ellipses with the linear constraints
+        :return: angles in [0, 2*pi] sorted along the first axis, shape (2M, K) (non-existing intersections are set
+        to 2*pi), and the change in the number of satisfied constraints when passing each angle, shape (2M, K)
+        """
+        theta, directions, _ = _intersection_angles(self.g1, self.g2, self.lincon.b)
+        return theta, directions
 
+    def active_slices(self):
+        """
+        Split every ellipse at its intersection angles into 2M+1 arcs and determine which arcs lie in the domain
+        :return: lower and upper angles of the arcs and a boolean mask of arcs in the domain, each of shape (2M+1, K)
+        """
+        theta, directions, n_satisfied_at_zero = _intersection_angles(self.g1, self.g2, self.lincon.b)
+        self.n_intersections = np.count_nonzero(directions)
+        n_chains = theta.shape[1]
+
+        lower = np.vstack((np.zeros((1, n_chains)), theta))
+        upper = np.vstack((theta, 2. * np.pi * np.ones((1, n_chains))))
+
+        n_satisfied = n_satisfied_at_zero + np.vstack((np.zeros((1, n_chains), dtype=int), directions.cumsum(axis=0)))
+
+        return lower, upper, _domain_from_count(n_satisfied, self.N_constraints, self.lincon.mode)
+
+
+def _constraint_arcs(g1, g2, b):
+    """
+    On the ellipse x(t) = a1 cos(t) + a2 sin(t), constraint m reads r cos(t - phi) + b >= 0 and is thus satisfied on
+    the arc [phi - alpha, phi + alpha] with alpha in [0, pi]. It is entered at the first and left at the second angle.
+    :param g1: A @ a1, shape (M, K)
+    :param g2: A @ a2, shape (M, K)
+    :param b: offset, shape (M, 1)
+    :return: entering and leaving angles in [0, 2*pi], shape (M, K), boolean mask of constraints that intersect the
+    ellipse and boolean mask of constraints that are satisfied at t=0, both of shape (M, K)
+    """
+    # angles are computed in double precision, also for single precision constraints
+    g1, g2, b = np.asarray(g1, dtype=np.float64), np.asarray(g2, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    r = np.sqrt(g1**2 + g2**2)
+    phi = np.arctan2(g2, g1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        arg = - b / r
+
+    # tangential and non-intersecting ellipses are either entirely inside or outside of the half-space
+    intersects = np.absolute(arg) < 1
+    alpha = np.arccos(np.where(intersects, arg, 1.))
+
+    enter = (phi - alpha) % (2. * np.pi)
+    leave = (phi + alpha) % (2. * np.pi)
+
+    # the arc contains t=0 iff it wraps around when mapped to [0, 2*pi]
+    satisfied_at_zero = np.where(intersects, enter > leave, b >= 0)
+    return enter, leave, intersects, satisfied_at_zero
+
+
+def _intersection_angles(g1, g2, b):
+    """
+    All of the up to 2M intersection angles together with the change in the number of satisfied constraints
+    :param g1: A @ a1, shape (M, K)
+    :param g2: A @ a2, shape (M, K)
+    :param b: offset, shape (M, 1)
+    :return: angles in [0, 2*pi] sorted along the first axis, shape (2M, K) (2*pi where there is no intersection), directions (+1 entering,
+    -1 leaving, 0 no intersection), shape (2M, K) and number of constraints satisfied at t=0, shape (K,)
+    """
+    enter, leave, intersects, satisfied_at_zero = _constraint_arcs(g1, g2, b)
+
+    theta = np.where(np.vstack((intersects, intersects)), np.vstack((enter, leave)), 2. * np.pi)
+    directions = np.vstack((intersects.astype(int), - intersects.astype(int)))
+
+    order = np.argsort(theta, axis=0, kind='stable')
+    theta = np.take_along_axis(theta, order, axis=0)
+    directions = np.take_along_axis(directions, order, axis=0)
+    return theta, directions, satisfied_at_zero.sum(axis=0)
+
+
+def _domain_from_count(n_satisfied, n_constraints, mode):
+    """
+    Translate the number of satisfied constraints into membership of the integration domain
+    :param n_satisfied: number of satisfied constraints (np.ndarray)
+    :param n_constraints: total number of constraints M
+    :param mode: 'Intersection' or 'Union'
+    :return: boolean array, True where inside the domain
+    """
+    if mode == 'Intersection':
+        return n_satisfied == n_constraints
+    elif mode == 'Union':
+        return n_satisfied > 0
+    else:
+        raise NotImplementedError
@@ -1,15 +1,20 @@
 import numpy as np
 
+from .. import get_rng
+
 
 class AngleSampler():
-    def __init__(self, active_intersections):
+    def __init__(self, active_intersections, rng=None):
         """
         Samples from a slice on an ellipse given through active intersections.
         :param active_intersections: ActiveIntersections object
+        :param rng: (optional) random number generator or seed (see get_rng)
         """
         self.active_intersections = active_intersections
+        self.rng = get_rng(rng)
         self.rotation_angle, self.rotated_slices = self.active_intersections.rotated_intersections()
         self.rotated_slices = self.rotated_slices.reshape(-1, 2)
+        self._cum_len = None
 
     def draw_angle(self):
         """
@@ -19,18 +24,62 @@ class AngleSampler():
         cum_len = self._get_slices_cumulative_length()
         l = cum_len[-1]
 
-        sample = l*np.random.rand()   # random angle
+        sample = l*self.rng.random()   # random angle
 
         # which slice are we in?
-        idx = np.searchsorted(cum_len, sample) - 1
+        idx = np.searchsorted(cum_len, sample, side='right') - 1
 
         return self.rotated_slices[idx, 0] + sample - cum_len[idx] + self.rotation_angle
 
+    def draw_angles(self, n):
+        """
+        Draw n independent sample angles from the given slice(s) at once
+        :param n: number of angles
+        :return: random angles from slice(s), shape (n,)
+        """
+        cum_len = self._get_slices_cumulative_length()
+        samples = cum_len[-1] * self.rng.random(n)   # random angles
+
+        # which slices are we in?
+        idx = np.searchsorted(cum_len, samples, side='right') - 1
+
+        return self.rotated_slices[idx, 0] + samples - cum_len[idx] + self.rotation_angle
+
     def _get_slices_cumulative_length(self):
         """
-        Compute the cumulative lengths of the slices, with a zero prepended
+        Compute the cumulative lengths of the slices, with a zero prepended. They are computed once per slice set.
         :return: array with cumulative lengths of the slices
         """
-        lengths = self.rotated_slices[:, 1] - self.rotated_slices[:, 0]
-        cum_len = lengths.cumsum()
-        return np.insert(cum_len, 0, 0)
+        if self._cum_len is None:
+            lengths = self.rotated_slices[:, 1] - self.rotated_slices[:, 0]
+            self._cum_len = np.concatenate(([0.], lengths.cumsum()))
+        return self._cum_len
+
+
+class BatchAngleSampler():
+    def __init__(self, batch_active_intersections, rng=None):
+        """
+        Samples one angle per ellipse from the slices given through batched active intersections.
+        :param batch_active_intersections: BatchActiveIntersections object
+        :param rng: (optional) random number generator or seed (see get_rng)
+        """
+        self.active_intersections = batch_active_intersections
+        self.rng = get_rng(rng)
+        self.lower, self.upper, self.active = self.active_intersections.active_slices()
+
+    def draw_angles(self):
+        """
+        Draw one sample angle per ellipse from its slice(s)
+        :return: random angles, shape (K,)
+        """
+        lengths = np.where(self.active, self.upper - self.lower, 0.)
+        cum_len = lengths.cumsum(axis=0)
+        l = cum_len[-1]
+
+        sample = l * self.rng.random(l.shape[0])   # random angles
+
+        # which slice are we in?
+        idx = np.argmax(cum_len > sample, axis=0)[None, :]
+
+        offset = np.take_along_axis(cum_len - lengths, idx, axis=0)
+        return (np.take_along_axis(self.lower, idx, axis=0) + sample - offset).squeeze(axis=0)
@@ -0,0 +1,96 @@
+import numpy as np
+
+
+def integrated_autocorrelation_time(x, window_factor=5.):
+    """
+    Estimate the integrated autocorrelation time tau = 1 + 2 sum_k rho_k of a scalar Markov chain statistic. The
+    autocorrelation function is computed with the FFT and the sum is truncated with Sokal's adaptive window, i.e. at
+    the smallest lag k with k >= window_factor * tau(k).
+    :param x: values of the statistic along the chain, shape (N,)
+    :param window_factor: constant of the adaptive window
+    :return: estimate of tau (1 for independent samples), the effective sample size is N / tau
+    """
+    x = np.asarray(x, dtype=float)
+    n = x.shape[0]
+    x = x - x.mean()
+    variance = np.dot(x, x)
+    if n < 2 or variance == 0.:
+        return 1.
+
+    f = np.fft.rfft(x, n=2 * n)
+    acf = np.fft.irfft(f * np.conj(f))[:n] / variance
+
+    taus = 2. * np.cumsum(acf) - 1.
+    window = np.arange(n) >= window_factor * taus
+    k = np.argmax(window) if window.any() else n - 1
+    return max(taus[k], 1. / n)
+
+
+class StreamingAutocorrelation():
+    def __init__(self, n_chains=1, n_batches=64):
+        """
+        Batch means estimate of the integrated autocorrelation time of a scalar statistic of one or several Markov
+        chains, in constant memory. The chains are split into at most n_batches consecutive batches per chain; once
+        they are filled, neighbouring batches are merged and the batch size is doubled. Then
+        tau = batch_size * Var[batch means] / Var[statistic], pooled over the chains.
+        :param n_chains: number of chains that are updated in lockstep
+        :param n_batches: maximum number of batches per chain (even)
+        """
+        self.n_chains = n_chains
+        self.n_batches = n_batches
+        self.batch_size = 1
+        self.n = 0
+
+        self._batch_sums = np.zeros((n_chains, n_batches))
+        self._n_full = 0
+        self._partial_sum = np.zeros(n_chains)
+        self._n_partial = 0
+
+        # running mean and sum of squared deviations of every chain
+        self._mean = np.zeros(n_chains)
+        self._m2 = np.zeros(n_chains)
+
+    def update(self, values):
+        """
+        Add the statistic of the next state of every chain
+        :param values: statistic, shape (n_chains,)
+        :return: None
+        """
+        values = np.asarray(values, dtype=float).reshape(self.n_chains)
+        self.n += 1
+        delta = values - self._mean
+        self._mean += delta / self.n
+        self._m2 += delta * (values - self._mean)
+
+        self._partial_sum += values
+        self._n_partial += 1
+        if self._n_partial == self.batch_size:
+            self._batch_sums[:, self._n_full] = self._partial_sum
+            self._n_full += 1
+            self._partial_sum = np.zeros(self.n_chains)
+            self._n_partial = 0
+
+            if self._n_full == self.n_batches:
+                half = self.n_batches // 2
+                self._batch_sums[:, :half] = self._batch_sums[:, 0::2] + self._batch_sums[:, 1::2]
+                self._batch_sums[:, half:] = 0.
+                self._n_full = half
+                self.batch_size *= 2
+
+    def autocorrelation_time(self):
+        """
+        :return: estimate of the integrated autocorrelation time (1 as long as there are less than two batches)
+        """
+        variance = self._m2.sum()
+        if self._n_full < 2 or variance == 0.:
+            return 1.
+
+        batch_means = self._batch_sums[:, :self._n_full] / self.batch_size
+        batch_variance = ((batch_means - batch_means.mean(axis=1, keepdims=True)) ** 2).sum() / (self._n_full - 1)
+        return max(self.batch_size * batch_variance / (variance / self.n), 1. / self.n)
+
+    def effective_sample_size(self):
+        """
+        :return: estimated number of independent samples the chains are worth
+        """
+        return self.n * self.n_chains / self.autocorrelation_time()
@@ -0,0 +1,142 @@
+import numpy as np
+import time
+import warnings
+
+from .. import get_rng
+from ..core.rng import standard_normal
+from .sampling_loop import SamplingLoop, BatchSamplerState
+from .ellipse import Ellipse
+from .angle_sampler import BatchAngleSampler
+from .active_intersections import BatchActiveIntersections
+from .autocorrelation import StreamingAutocorrelation
+
+
+class BatchEllipticalSliceSampler(SamplingLoop):
+    def __init__(self, n_iterations, linear_constraints, n_skip, X_init, thinning=1, max_samples=None,
+                 instrumentation=None, n_pilot=20, rng=None):
+        """
+        Loop for sampling from a linearly constrained Gaussian with K Markov chains that are advanced in lockstep.
+        Intersections, slices and angles of all chains are computed jointly, such that every step requires only one
+        matrix-matrix product with the constraint matrix.
+        :param n_iterations: Number of desired core iterations per chain (integer)
+        :param linear_constraints: an instance of LinearConstraints
+        :param n_skip: number of samples to skip in order to get more independent samples, or 'auto' to choose it from
+        the autocorrelation time of pilot chains (see tune_n_skip)
+        :param X_init: Initial samples from domain of interest, one per chain, np.ndarray with shape (dimension, K)
+        :param thinning: only every thinning-th iteration is stored in the loop state
+        :param max_samples: if given, the loop state only keeps the last max_samples iterations of every chain
+        :param instrumentation: (optional) Instrumentation instance that records counters and timers
+        :param n_pilot: length of the pilot chains if n_skip='auto'
+        :param rng: (optional) random number generator or seed (see get_rng), defaults to the global numpy random state
+        """
+        super().__init__(n_iterations, linear_constraints, n_skip)
+        self.dim = self.lincon.N_dim
+        self.instrumentation = instrumentation
+        self.rng = get_rng(rng)
+        self.n_chains = X_init.shape[1]
+
+        X_init = X_init.astype(self.lincon.dtype, copy=False)
+        # constraint values (without offset) of the current state of every chain
+        self.AX = self.lincon.project(X_init)
+
+        margin_init = self._margin(self.AX)
+        if np.any(margin_init < 0):
+            raise ValueError('All initial samples have to lie in the domain!')
+        self.loop_state = BatchSamplerState(X_init, n_iterations, thinning, max_samples, margin_init)
+
+        # autocorrelation of the margin of the constraints along the chains, pooled over the chains
+        self.autocorrelation = StreamingAutocorrelation(self.n_chains)
+        if n_skip == 'auto':
+            self.n_skip = self.tune_n_skip(n_pilot)
+
+    def run(self):
+        """
+        Sample from a linearly constrained unit Gaussian until stopping criterion is reached.
+        :return: None
+        """
+        while not self.is_converged():
+            if self.instrumentation is not None:
+                t = time.perf_counter()
+
+            X = self.loop_state.last
+            for i in range(self.n_skip + 1):
+                X, self.AX, margin = self.compute_next_points(X, self.AX)
+
+            self.loop_state.update(X, margin)
+            self.autocorrelation.update(margin)
+            if self.instrumentation is not None:
+                self.instrumentation.add_time('step', time.perf_counter() - t)
+                self.instrumentation.count('samples', self.n_chains)
+
+    def tune_n_skip(self, n_pilot=20):
+        """
+        Advance all chains without skipping from their current states and choose n_skip = ceil(tau) - 1 with the
+        integrated autocorrelation time tau of the margin of the constraints, pooled over the chains. The chains
+        continue from the end of the pilot chains.
+        :param n_pilot: length of the pilot chains
+        :return: n_skip
+        """
+        pilot = StreamingAutocorrelation(self.n_chains)
+        X, AX = self.loop_state.last, self.AX
+        for i in range(n_pilot):
+            X, AX, margin = self.compute_next_points(X, AX)
+            pilot.update(margin)
+        self.loop_state.last, self.AX = X, AX
+        return int(max(np.ceil(pilot.autocorrelation_time()) - 1, 0))
+
+    def effective_sample_size(self):
+        """
+        Effective sample size of the samples of all chains so far, estimated from the autocorrelation of the margin of
+        the constraints (excluding the initial states)
+        :return: effective sample size
+        """
+        return self.autocorrelation.effective_sample_size()
+
+    def compute_next_points(self, X0, AX0):
+        """
+        Computes the next sample of every chain
+        :param X0: current states, shape (D, K)
+        :param AX0: A @ X0, shape (M, K)
+        :return: new states (D, K), their constraint values A @ X (M, K) and the margins of the constraints (K,)
+        """
+        X1 = standard_normal(self.rng, (self.dim, X0.shape[1]), self.lincon.dtype)
+        if self.instrumentation is not None:
+            t = time.perf_counter()
+        AX1 = self.lincon.project(X1)
+        if self.instrumentation is not None:
+            self.instrumentation.add_time('projection', time.perf_counter() - t)
+
+        ellipse = Ellipse(X0, X1)
+        active_intersections = BatchActiveIntersections(ellipse, self.lincon, AX0, AX1)
+        angle_sampler = BatchAngleSampler(active_intersections, self.rng)
+        t_new = angle_sampler.draw_angles()
+
+        if self.instrumentation is not None:
+            active = angle_sampler.active
+            self.instrumentation.count('ess_steps', X0.shape[1])
+            self.instrumentation.count('intersections', active_intersections.n_intersections)
+            # slices are maximal runs of active arcs, i.e. inactive-to-active transitions along the ellipse
+            self.instrumentation.count('active_slices', np.count_nonzero(active & ~np.roll(active, 1, axis=0)) +
+                                       np.count_nonzero(np.all(active, axis=0)))
+
+        X = ellipse.x(t_new).astype(self.lincon.dtype, copy=False)
+        AX = (AX0 * np.cos(t_new) + AX1 * np.sin(t_new)).astype(self.lincon.dtype, copy=False)
+
+        margin = self._margin(AX)
+        outside = margin < 0
+        if np.any(outside):
+            if self.instrumentation is not None:
+                self.instrumentation.count('out_of_domain_resamples', np.count_nonzero(outside))
+            else:
+                warnings.warn('Point outside domain, resample', RuntimeWarning)
+            X[:, outside], AX[:, outside], margin[outside] = self.compute_next_points(X0[:, outside], AX0[:, outside])
+
+        return X, AX, margin
+
+    def _margin(self, AX):
+        """ Margin of the constraints of every chain, which decides acceptance and whose autocorrelation is tracked """
+        return self.lincon.margin_from_evaluation(AX + self.lincon.b)
+
+    def is_converged(self):
+        """ Stopping criterion for sampling core """
+        return self.loop_state.iteration >= self.n_iterations
@@ -11,6 +11,7 @@ class Ellipse():
         """
         self.a1 = a1
         self.a2 = a2
+        self._basis = None
 
     def x(self, theta):
         """
@@ -20,3 +21,15 @@ class Ellipse():
         """
         return self.a1 * np.cos(theta) + self.a2 * np.sin(theta)
 
+    def x_batch(self, theta):
+        """
+        locations on the ellipse at many angles, computed as one product of the (D, 2) basis [a1, a2] with the
+        (2, n) matrix of cosines and sines
+        :param theta: angles, shape (n,)
+        :return: locations x on ellipse, shape (D, n)
+        """
+        if self._basis is None:
+            self._basis = np.hstack((self.a1, self.a2))
+        theta = np.asarray(theta).reshape(-1)
+        return np.dot(self._basis, np.vstack((np.cos(theta), np.sin(theta))))
+
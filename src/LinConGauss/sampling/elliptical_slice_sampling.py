@@ -1,35 +1,61 @@
 
 import numpy as np
+import time
+import warnings
 
+from .. import find_feasible_point, get_rng
+from ..core.rng import standard_normal
 from .sampling_loop import SamplingLoop, SamplerState
 from .ellipse import Ellipse
 from .angle_sampler import AngleSampler
 from .active_intersections import ActiveIntersections
+from .autocorrelation import StreamingAutocorrelation
 
 
 class EllipticalSliceSampler(SamplingLoop):
-    def __init__(self, n_iterations, linear_constraints, n_skip, x_init=None):
+    def __init__(self, n_iterations, linear_constraints, n_skip, x_init=None, thinning=1, max_samples=None,
+                 instrumentation=None, n_pilot=100, rng=None, x_candidates=None):
         """
         Loop for sampling from a linearly constrained Gaussian
         :param n_iterations: Number of desired core iterations (integer)
         :param linear_constraints: an instance of LinearConstraints
-        :param n_skip: number of samples to skip in order to get more independent samples
-        :param x_init: Initial sample(s) from domain of interest, np.ndarray with shape (dimension, number of samples)
+        :param n_skip: number of samples to skip in order to get more independent samples, or 'auto' to choose it from
+        the autocorrelation time of a pilot chain (see tune_n_skip)
+        :param x_init: Initial sample(s) from domain of interest, np.ndarray with shape (dimension, number of samples).
+        If None, a point in the domain is computed with find_feasible_point.
+        :param thinning: only every thinning-th iteration is stored in the loop state
+        :param max_samples: if given, the loop state only keeps the last max_samples samples
+        :param instrumentation: (optional) Instrumentation instance that records counters and timers
+        :param n_pilot: length of the pilot chain if n_skip='auto'
+        :param rng: (optional) random number generator or seed (see get_rng), defaults to the global numpy random state
+        :param x_candidates: (optional) points that are tried first if x_init is None, e.g. x_inits from subset
+        simulation, shape (D, N)
         """
         super().__init__(n_iterations, linear_constraints, n_skip)
         self.dim = self.lincon.N_dim
+        self.instrumentation = instrumentation
+        self.rng = get_rng(rng)
 
         if x_init is None:
-            # need to find a sample that lies in the domain :(
-            found_sample = False
-            print('[EllipticalSliceSampler] searching x_init')
-            while not found_sample:
-                x_init = np.random.randn(self.dim, 1)
-                if self.lincon.integration_domain(x_init):
-                    found_sample = True
-                    print('[EllipticalSliceSampler] found x_init')
+            # need to find a sample that lies in the domain, raises a ValueError if the domain is empty
+            x_init = find_feasible_point(self.lincon, x_candidates)
+        x_init = x_init.astype(self.lincon.dtype, copy=False)
 
-        self.loop_state = SamplerState(x_init)
+        # the margins of the constraints are stored alongside the samples, such that nestings can be decided without
+        # evaluating the constraints again
+        Ax_init = self.lincon.project(x_init)
+        self.loop_state = SamplerState(x_init, n_iterations, thinning, max_samples,
+                                       self.lincon.margin_from_evaluation(Ax_init + self.lincon.b))
+
+        # constraint values (without offset) of the current state, carried through the chain
+        self.Ax = Ax_init[:, -1:]
+        # margins of the constraints at the samples of the last chunk of iter_samples, None before the first chunk
+        self.chunk_margins = None
+
+        # autocorrelation of the margin of the constraints along the chain of returned samples
+        self.autocorrelation = StreamingAutocorrelation()
+        if n_skip == 'auto':
+            self.n_skip = self.tune_n_skip(n_pilot)
 
     def run(self):
         """
@@ -37,14 +63,64 @@ class EllipticalSliceSampler(SamplingLoop):
         :return: None
         """
         while not self.is_converged():
-            x = self.loop_state.samples[-1]
-            for i in range(self.n_skip + 1):
-                x = self.compute_next_point(x)
-                while not self.lincon.integration_domain(x):
-                    print('Point outside domain, resample')
-                    x = self.compute_next_point(self.loop_state.samples[-1])
+            x, self.Ax, margin = self._advance(self.loop_state.last, self.Ax)
+            self.loop_state.update(x, margin)
+            self.autocorrelation.update(margin)
+            if self.instrumentation is not None:
+                self.instrumentation.count('samples')
+
+    def iter_samples(self, n_samples, chunk_size=1, sink=None):
+        """
+        Generator that continues the chain from its current state and yields the samples in chunks as they are
+        produced. Samples are not stored in the loop state, such that memory is constant in n_samples. The margins of
+        the constraints at the samples of the last chunk are kept in self.chunk_margins.
+        :param n_samples: total number of samples to draw
+        :param chunk_size: number of samples per chunk
+        :param sink: (optional) object with a write method (e.g. MemmapSampleSink) that receives every chunk
+        :return: generator of samples with shape (D, chunk_size) (the last chunk may be smaller)
+        """
+        x, Ax = self.loop_state.last, self.Ax
+        for start in range(0, n_samples, chunk_size):
+            chunk = np.empty((self.dim, min(chunk_size, n_samples - start)), dtype=x.dtype)
+            self.chunk_margins = np.empty(chunk.shape[1])
+            for j in range(chunk.shape[1]):
+                x, Ax, margin = self._advance(x, Ax)
+                chunk[:, j] = x[:, 0]
+                self.chunk_margins[j] = margin[0]
+                self.autocorrelation.update(margin)
+            if self.instrumentation is not None:
+                self.instrumentation.count('samples', chunk.shape[1])
+
+            # the chain continues from here in subsequent calls
+            self.loop_state.last, self.Ax = x, Ax
+            if sink is not None:
+                sink.write(chunk)
+            yield chunk
 
-            self.loop_state.update(x)
+    def tune_n_skip(self, n_pilot=100):
+        """
+        Run a pilot chain without skipping from the current state and choose n_skip such that consecutive returned
+        samples are roughly independent, i.e. n_skip = ceil(tau) - 1 with the integrated autocorrelation time tau of
+        the margin of the constraints. The chain continues from the end of the pilot chain, which serves as burn-in.
+        :param n_pilot: length of the pilot chain
+        :return: n_skip
+        """
+        pilot = StreamingAutocorrelation()
+        self.n_skip = 0
+        x, Ax = self.loop_state.last, self.Ax
+        for i in range(n_pilot):
+            x, Ax, margin = self._advance(x, Ax)
+            pilot.update(margin)
+        self.loop_state.last, self.Ax = x, Ax
+        return int(max(np.ceil(pilot.autocorrelation_time()) - 1, 0))
+
+    def effective_sample_size(self):
+        """
+        Effective sample size of the samples returned so far, estimated from the autocorrelation of the margin of the
+        constraints
+        :return: effective sample size
+        """
+        return self.autocorrelation.effective_sample_size()
 
     def compute_next_point(self, x0):
         """
@@ -52,17 +128,69 @@ class EllipticalSliceSampler(SamplingLoop):
         :param x0: current state
         :return: new state
         """
-        x1 = np.random.randn(self.lincon.N_dim, 1)
+        return self._next_point(x0, self.lincon.project(x0))[0]
+
+    def _advance(self, x, Ax):
+        """
+        Advance the chain by n_skip + 1 steps
+        :param x: current state, shape (D, 1)
+        :param Ax: A @ x, shape (M, 1)
+        :return: new state, its constraint values A @ x and the margin of the constraints, shape (1,)
+        """
+        if self.instrumentation is not None:
+            t = time.perf_counter()
+
+        for i in range(self.n_skip + 1):
+            x_new, Ax_new = self._next_point(x, Ax)
+            margin = self._margin(Ax_new)
+            while margin[0] < 0:
+                if self.instrumentation is not None:
+                    self.instrumentation.count('out_of_domain_resamples')
+                else:
+                    warnings.warn('Point outside domain, resample', RuntimeWarning)
+                x_new, Ax_new = self._next_point(x, Ax)
+                margin = self._margin(Ax_new)
+            x, Ax = x_new, Ax_new
+
+        if self.instrumentation is not None:
+            self.instrumentation.add_time('step', time.perf_counter() - t)
+        return x, Ax, margin
+
+    def _next_point(self, x0, Ax0):
+        """
+        Computes the next sample given the constraint values of the current state. Since the new state is a linear
+        combination of x0 and x1, so are its constraint values, and only A @ x1 has to be computed.
+        :param x0: current state, shape (D, 1)
+        :param Ax0: A @ x0, shape (M, 1)
+        :return: new state and its constraint values A @ x
+        """
+        x1 = standard_normal(self.rng, (self.lincon.N_dim, 1), self.lincon.dtype)
+        if self.instrumentation is not None:
+            t = time.perf_counter()
+        Ax1 = self.lincon.project(x1)
+        if self.instrumentation is not None:
+            self.instrumentation.add_time('projection', time.perf_counter() - t)
         ellipse = Ellipse(x0, x1)
-        active_intersections = ActiveIntersections(ellipse, self.lincon)
-        slice_sampler = AngleSampler(active_intersections)
+        active_intersections = ActiveIntersections(ellipse, self.lincon, Ax0, Ax1)
+        slice_sampler = AngleSampler(active_intersections, self.rng)
 
         if not active_intersections.ellipse_in_domain:
             # ellipse is outside of integration domain, reconstruct a new ellipse (should not happen at all!)
             raise ValueError('At least one point should be in the domain!')
 
+        if self.instrumentation is not None:
+            self.instrumentation.count('ess_steps')
+            self.instrumentation.count('intersections', active_intersections.n_intersections)
+            self.instrumentation.count('active_slices', slice_sampler.rotated_slices.shape[0])
+
         t_new = slice_sampler.draw_angle()
-        return ellipse.x(t_new)
+        dtype = self.lincon.dtype
+        return ellipse.x(t_new).astype(dtype, copy=False), (Ax0 * np.cos(t_new) + Ax1 * np.sin(t_new)).astype(dtype,
+                                                                                                      copy=False)
+
+    def _margin(self, Ax):
+        """ Margin of the constraints, which decides acceptance and whose autocorrelation is tracked """
+        return self.lincon.margin_from_evaluation(Ax + self.lincon.b)
 
     def is_converged(self):
         """ Stopping criterion for sampling core """
@@ -0,0 +1,45 @@
+import numpy as np
+
+
+class MemmapSampleSink():
+    def __init__(self, path, dim, n_samples, dtype=np.float64):
+        """
+        Writes chunks of samples into a memory-mapped .npy file of shape (D, N) as they are produced. The file is
+        stored in Fortran order, such that every chunk of samples is a contiguous block on disk.
+        :param path: path of the .npy file
+        :param dim: dimension D of the samples
+        :param n_samples: total number of samples N the file can hold
+        :param dtype: data type of the stored samples
+        """
+        self.path = path
+        self.samples = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(dim, n_samples),
+                                                 fortran_order=True)
+        self.n_written = 0
+
+    def write(self, chunk):
+        """
+        Append a chunk of samples
+        :param chunk: samples, shape (D, n)
+        :return: None
+        """
+        n = chunk.shape[1]
+        if self.n_written + n > self.samples.shape[1]:
+            raise ValueError('Sink can only hold {} samples.'.format(self.samples.shape[1]))
+
+        self.samples[:, self.n_written:self.n_written + n] = chunk
+        self.n_written += n
+
+    def flush(self):
+        """ Write changes to disk """
+        self.samples.flush()
+
+    def close(self):
+        """ Flush and release the memory map """
+        self.flush()
+        del self.samples
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
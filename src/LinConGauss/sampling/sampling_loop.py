@@ -25,17 +25,116 @@ class SamplingLoop(Loop):
 
 class SamplerState(LoopState):
     """
-    Contains the state of the sampling loop, which includes a history of all evaluated locations
+    Contains the state of the sampling loop, which includes a history of all evaluated locations.
+    Samples are written in place into a preallocated buffer of shape (D, n_init + n_iterations, K), where K is the
+    number of chains (K=1 for a single chain).
     """
-    def __init__(self, x_init) -> None:
-        self.samples = [x_init[:, i][:, None] for i in range(x_init.shape[-1])]
+    def __init__(self, x_init, n_iterations=0, thinning=1, max_samples=None, margin_init=None) -> None:
+        """
+        :param x_init: initial sample(s) with shape (D, n_init)
+        :param n_iterations: number of iterations to allocate memory for (the buffer grows if this is exceeded)
+        :param thinning: only every thinning-th iteration is stored
+        :param max_samples: if given, only the last max_samples samples are kept in a ring buffer
+        :param margin_init: (optional) margins of the constraints at the initial sample(s), shape (n_init,). If given,
+        the margin of every stored sample is kept alongside it.
+        """
         self.iteration = 0
+        self.thinning = thinning
+        self.max_samples = max_samples
+
+        initial_samples = self._initial_samples(x_init)
+        if max_samples is None:
+            capacity = len(initial_samples) + n_iterations // thinning
+        else:
+            capacity = max_samples
+
+        self._buffer = np.empty((x_init.shape[0], max(capacity, 1), initial_samples[-1].shape[1]),
+                                dtype=np.result_type(x_init, np.float32))
+        self._margin_buffer = None
+        initial_margins = [None] * len(initial_samples)
+        if margin_init is not None:
+            self._margin_buffer = np.empty(self._buffer.shape[1:])
+            initial_margins = self._initial_margins(margin_init)
+
+        self.n_stored = 0
+        for x, margin in zip(initial_samples, initial_margins):
+            self._store(x, margin)
+
+        # current state of the chain(s), which is not necessarily stored when thinning
+        self.last = initial_samples[-1]
         super().__init__()
 
-    def update(self, x_new) -> None:
+    def update(self, x_new, margin=None) -> None:
         self.iteration += 1
-        self.samples.append(x_new)
+        self.last = x_new
+        if self.iteration % self.thinning == 0:
+            self._store(x_new, margin)
+
+    @property
+    def X(self):
+        """ Stored samples in chronological order, shape (D, N). This is a view unless the ring buffer wrapped. """
+        return self._ordered().reshape(self._buffer.shape[0], -1)
+
+    @property
+    def margins(self):
+        """ Margins of the stored samples in the order of X, shape (N,), or None if margins are not kept """
+        if self._margin_buffer is None:
+            return None
+        return self._ordered(self._margin_buffer[None])[0].reshape(-1)
+
+    @property
+    def samples(self):
+        """ List of the stored samples in chronological order """
+        ordered = self._ordered()
+        return [ordered[:, i] for i in range(ordered.shape[1])]
+
+    def _initial_samples(self, x_init):
+        """ Split initial samples into a list of states, one per column """
+        return [x_init[:, i][:, None] for i in range(x_init.shape[-1])]
+
+    def _initial_margins(self, margin_init):
+        """ Split initial margins into a list, one per initial state """
+        return [margin_init[i:i + 1] for i in range(margin_init.shape[0])]
+
+    def _store(self, x, margin=None):
+        """ Write a state (and its margin) into the buffer """
+        capacity = self._buffer.shape[1]
+        if self.max_samples is not None:
+            index = self.n_stored % capacity
+        else:
+            if self.n_stored == capacity:
+                self._buffer = np.concatenate((self._buffer, np.empty_like(self._buffer)), axis=1)
+                if self._margin_buffer is not None:
+                    self._margin_buffer = np.concatenate((self._margin_buffer, np.empty_like(self._margin_buffer)))
+            index = self.n_stored
+        self._buffer[:, index] = x
+        if self._margin_buffer is not None:
+            self._margin_buffer[index] = margin
+        self.n_stored += 1
+
+    def _ordered(self, buffer=None):
+        """ Stored samples (or another buffer of the same layout) in chronological order, shape (D, N, K) """
+        buffer = self._buffer if buffer is None else buffer
+        capacity = buffer.shape[1]
+        if self.n_stored <= capacity:
+            return buffer[:, :self.n_stored]
+        start = self.n_stored % capacity
+        return np.concatenate((buffer[:, start:], buffer[:, :start]), axis=1)
+
+
+class BatchSamplerState(SamplerState):
+    """
+    Contains the state of K Markov chains that are advanced in lockstep
+    """
+    def _initial_samples(self, x_init):
+        """ The initial samples are the initial states of the K chains """
+        return [x_init]
+
+    def _initial_margins(self, margin_init):
+        """ The initial margins are those of the initial states of the K chains """
+        return [margin_init]
 
     @property
     def X(self):
-        return np.hstack(self.samples)
\ No newline at end of file
+        """ Stored samples, ordered by iteration and then by chain, shape (D, N * K) """
+        return super().X
@@ -0,0 +1,29 @@
+import pytest
+
+from LinConGauss.multilevel_splitting import Checkpoint
+
+
+class PreemptedCheckpoint(Checkpoint):
+    """ Checkpoint that simulates a preemption of the job after a number of saves """
+    def __init__(self, path, chunk_size=None, n_saves=1):
+        super().__init__(path, chunk_size)
+        self.n_saves = n_saves
+
+    def save(self, **arrays):
+        super().save(**arrays)
+        self._count_save()
+
+    def save_chunk(self, index, **arrays):
+        super().save_chunk(index, **arrays)
+        self._count_save()
+
+    def _count_save(self):
+        self.n_saves -= 1
+        if self.n_saves == 0:
+            raise KeyboardInterrupt
+
+
+@pytest.fixture
+def preempted_checkpoint():
+    """ Checkpoint class that raises a KeyboardInterrupt after n_saves saves """
+    return PreemptedCheckpoint
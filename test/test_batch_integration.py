@@ -0,0 +1,43 @@
+import numpy as np
+from math import erf
+
+from LinConGauss.multilevel_splitting import BatchIntegration
+
+# orthant-type domains with known integral: prod_i Phi(b_i)
+n_dim = 5
+np.random.seed(0)
+b = np.random.randn(n_dim, 1)
+B = b + np.linspace(0., 0.2, 4)[None, :] * np.asarray([[1., -1., 1., -1., 1.]]).T
+
+batch_integrator = BatchIntegration(np.eye(n_dim), B, 256, 32, 0.5, n_skip=1)
+log_integrals = batch_integrator.run()
+
+
+def test_batch_log_integrals():
+    """ Check the log integrals against their true values """
+    true_log_integrals = np.log([np.prod([0.5 * (1 + erf(x / np.sqrt(2))) for x in B[:, l]])
+                                 for l in range(B.shape[1])])
+    assert log_integrals.shape == (B.shape[1],)
+    assert np.allclose(log_integrals, true_log_integrals, atol=0.5)
+
+
+def test_batch_warm_start():
+    """ Check that neighbouring offsets recycle the shift sequence and report diagnostics per offset """
+    diagnostics = batch_integrator.tracker.diagnostics()
+    assert len(diagnostics) == B.shape[1]
+    assert not diagnostics[0]['warm_started']
+    assert all(d['warm_started'] for d in diagnostics[1:])
+    assert all(d['shift_sequence'][-1] == 0. for d in diagnostics)
+
+
+def test_batch_warm_start_sweep():
+    """ Check that warm starts along a monotone sweep of offsets do not add nestings """
+    B_sweep = b - 1. - np.linspace(0., 0.6, 12)[None, :]
+    sweep = BatchIntegration(np.eye(n_dim), B_sweep, 32, 32, 0.5, rng=0)
+    sweep.run()
+    diagnostics = sweep.tracker.diagnostics()
+    assert any(d['warm_started'] for d in diagnostics)
+    for previous, current in zip(diagnostics[:-1], diagnostics[1:]):
+        if current['warm_started']:
+            assert current['n_nestings'] == previous['n_nestings']
+            assert current['shift_sequence'][-1] == 0.
@@ -0,0 +1,57 @@
+import json
+
+import numpy as np
+
+from LinConGauss.cli import load_problems, main
+
+# box x_1 >= 1.5, x_2 >= 1 with probability 0.0668072 * 0.1586553
+A = np.eye(2)
+b = -np.array([[1.5], [1.]])
+log_probability = np.log(0.0668072 * 0.1586553)
+
+
+def test_cli_batch(tmp_path):
+    """ Runs a directory with a valid and a broken problem and checks the streamed results and the retries """
+    np.savez(tmp_path / 'box.npz', A=A, b=b, n_samples=128)
+    np.savez(tmp_path / 'broken.npz', A=A)
+    output = str(tmp_path / 'results.jsonl')
+
+    assert main([str(tmp_path), '--output', output, '--n-jobs', '2', '--retries', '1', '--seed', '0', '--quiet']) == 1
+    with open(output) as f:
+        records = {record['name']: record for record in map(json.loads, f)}
+
+    assert records['broken']['status'] == 'failed' and records['broken']['attempts'] == 2
+    box = records['box']
+    assert box['status'] == 'ok' and box['attempts'] == 1
+    assert abs(box['log_integral'] - log_probability) < 1.
+    assert np.isclose(box['log2_integral'], box['log_integral'] / np.log(2))
+    assert np.isclose(np.sum(np.log(box['conditional_probabilities'])), box['log_integral'])
+    assert len(box['conditional_probabilities']) == box['n_nestings']
+
+
+def test_cli_manifest_time_limit(tmp_path):
+    """ Checks manifest options and that jobs over the time limit are terminated and reported """
+    np.savez(tmp_path / 'box.npz', A=A, b=b)
+    manifest = tmp_path / 'manifest.jsonl'
+    manifest.write_text('{"path": "box.npz", "name": "slow", "n_samples": 1000000}\n'
+                        '{"path": "box.npz", "name": "fast", "n_samples": 16}\n')
+    problems = load_problems(str(manifest))
+    assert [problem['options'] for problem in problems] == [{'n_samples': 1000000}, {'n_samples': 16}]
+
+    output = str(tmp_path / 'results.jsonl')
+    main([str(manifest), '--output', output, '--time-limit', '2', '--retries', '0', '--quiet'])
+    with open(output) as f:
+        records = {record['name']: record for record in map(json.loads, f)}
+    assert records['slow']['status'] == 'timeout'
+    assert records['fast']['status'] == 'ok'
+
+
+def test_cli_cache(tmp_path):
+    """ Checks that a repeated problem skips subset simulation with a cache """
+    np.savez(tmp_path / 'box.npz', A=A, b=b, n_samples=16)
+    output = str(tmp_path / 'results.jsonl')
+    for i in range(2):
+        main([str(tmp_path / 'box.npz'), '--output', output, '--cache', str(tmp_path / 'cache'), '--quiet'])
+    with open(output) as f:
+        records = list(map(json.loads, f))
+    assert [record['cached_shift_sequence'] for record in records] == [False, True]
@@ -1,7 +1,10 @@
 import numpy as np
 
 from LinConGauss import LinearConstraints
-from LinConGauss.sampling import Ellipse, ActiveIntersections, AngleSampler, EllipticalSliceSampler
+from LinConGauss.sampling import Ellipse, ActiveIntersections, AngleSampler, EllipticalSliceSampler, \
+    BatchEllipticalSliceSampler, MemmapSampleSink, integrated_autocorrelation_time, \
+    StreamingAutocorrelation
+from LinConGauss.sampling.sampling_loop import SamplerState
 
 
 def test_ellipse_shape():
@@ -39,6 +42,34 @@ def test_samples_from_ellipse_in_domain():
     assert lincon.integration_domain(x).prod() == 1.
 
 
+def test_draw_angles_batch():
+    """
+    Tests that a batch of angles from the triangular domain above matches single draws, lies in the domain and
+    distributes over the slices in proportion to their lengths
+    """
+    A = np.asarray([[0, 1], [-np.sqrt(3), -1], [np.sqrt(3), -1]])
+    b = np.sqrt(3) / 6. * np.asarray([[1., 2., 2]]).T
+
+    lincon = LinearConstraints(A, b, mode='Intersection')
+    ellipse = Ellipse(np.asarray([[1 / 3.], [0]]), np.asarray([[0], [1 / 3.]]))
+    intersect = ActiveIntersections(ellipse, lincon)
+
+    single = AngleSampler(intersect, rng=0)
+    batch = AngleSampler(intersect, rng=0)
+    assert np.allclose(batch.draw_angles(10), [single.draw_angle() for i in range(10)])
+
+    N = 30000
+    angles = batch.draw_angles(N)
+    x = ellipse.x_batch(angles)
+    assert x.shape == (2, N) and np.allclose(x, ellipse.x(angles))
+    assert lincon.integration_domain(x).prod() == 1.
+
+    slices = (batch.rotated_slices + batch.rotation_angle) % (2 * np.pi)
+    lengths = batch.rotated_slices[:, 1] - batch.rotated_slices[:, 0]
+    fractions = [np.mean((angles - lower) % (2 * np.pi) < length) for lower, length in zip(slices[:, 0], lengths)]
+    assert np.allclose(fractions, lengths / lengths.sum(), atol=0.02)
+
+
 def test_ess_samples_in_domain():
     """
     Tests if all samples lie within the integral domain when using elliptical slice sampling
@@ -51,3 +82,135 @@ def test_ess_samples_in_domain():
 
     sampler.run()
     assert np.all(lincon.integration_domain(sampler.loop_state.X)) == 1.
+
+
+def test_ess_x_candidates():
+    """ Tests that the chain starts at the first candidate inside the domain if no initial point is given """
+    lincon = LinearConstraints(np.eye(2), -np.ones((2, 1)))
+    x_candidates = np.asarray([[0., 2.], [0., 3.]])
+    sampler = EllipticalSliceSampler(10, lincon, n_skip=0, x_candidates=x_candidates, rng=0)
+    assert np.all(sampler.loop_state.X[:, 0] == x_candidates[:, 1])
+
+
+def test_batch_ess_samples_in_domain():
+    """
+    Tests if all samples of a batch of Markov chains lie within the integral domain
+    """
+    n_lc = 5
+    n_dim = 3
+    n_chains = 20
+    np.random.seed(0)
+    lincon = LinearConstraints(2 * np.random.randn(n_lc, n_dim), np.random.randn(n_lc, 1))
+    x_init = EllipticalSliceSampler(0, lincon, n_skip=0).loop_state.X
+    sampler = BatchEllipticalSliceSampler(100, lincon, n_skip=1, X_init=np.repeat(x_init, n_chains, axis=1))
+
+    sampler.run()
+    assert sampler.loop_state.X.shape == (n_dim, 101 * n_chains)
+    assert np.all(lincon.integration_domain(sampler.loop_state.X) == 1.)
+
+
+def test_active_intersections_closed_form():
+    """
+    Tests that the closed-form slices of the triangular domain from above alternate between inside and outside
+    """
+    A = np.asarray([[0, 1], [-np.sqrt(3), -1], [np.sqrt(3), -1]])
+    b = np.sqrt(3) / 6. * np.asarray([[1., 2., 2]]).T
+
+    lincon = LinearConstraints(A, b, mode='Intersection')
+    ellipse = Ellipse(np.asarray([[1 / 3.], [0]]), np.asarray([[0], [1 / 3.]]))
+    theta = ActiveIntersections(ellipse, lincon).find_active_intersections()
+    assert theta.size == 6
+
+    slices = theta.reshape(-1, 2)
+    inside = (slices[:, 0] + ((slices[:, 1] - slices[:, 0]) % (2 * np.pi)) / 2.)
+    outside = (slices[:, 1] + ((np.roll(slices[:, 0], -1) - slices[:, 1]) % (2 * np.pi)) / 2.)
+    assert np.all(lincon.integration_domain(ellipse.x(inside)) == 1)
+    assert np.all(lincon.integration_domain(ellipse.x(outside)) == 0)
+
+
+def test_ess_cached_constraint_values():
+    """
+    Tests that the constraint values carried through the chain agree with A @ x of the current state
+    """
+    np.random.seed(1)
+    lincon = LinearConstraints(np.random.randn(20, 10), np.random.rand(20, 1))
+    sampler = EllipticalSliceSampler(500, lincon, n_skip=2, x_init=np.zeros((10, 1)))
+
+    sampler.run()
+    assert np.allclose(sampler.Ax, np.dot(lincon.A, sampler.loop_state.last))
+
+
+def test_sampler_state_buffer():
+    """
+    Tests the preallocated sample storage, its ring buffer and thinning
+    """
+    D = 4
+    X = np.random.randn(D, 10)
+
+    state = SamplerState(X[:, :2], n_iterations=8)
+    for i in range(2, 10):
+        state.update(X[:, i, None])
+    assert np.array_equal(state.X, X)
+    assert np.shares_memory(state.X, state._buffer)
+
+    ring = SamplerState(X[:, :2], n_iterations=8, max_samples=3)
+    thinned = SamplerState(X[:, :2], n_iterations=8, thinning=2)
+    for i in range(2, 10):
+        ring.update(X[:, i, None])
+        thinned.update(X[:, i, None])
+    assert np.array_equal(ring.X, X[:, -3:])
+    assert np.array_equal(thinned.X, X[:, [0, 1, 3, 5, 7, 9]])
+    assert np.array_equal(thinned.last, X[:, -1:])
+
+
+def test_ess_streaming_to_sink(tmp_path):
+    """
+    Tests that streamed samples arrive in chunks, lie in the domain and are written to the memory-mapped file
+    """
+    np.random.seed(2)
+    lincon = LinearConstraints(np.random.randn(5, 3), np.random.rand(5, 1))
+    sampler = EllipticalSliceSampler(0, lincon, n_skip=0, x_init=np.zeros((3, 1)))
+    assert sampler.chunk_margins is None
+
+    path = str(tmp_path / 'samples.npy')
+    with MemmapSampleSink(path, 3, 25) as sink:
+        chunks = list(sampler.iter_samples(25, chunk_size=10, sink=sink))
+    assert [chunk.shape[1] for chunk in chunks] == [10, 10, 5]
+    assert np.allclose(sampler.chunk_margins, lincon.margin_from_evaluation(lincon.evaluate(chunks[-1])))
+    assert sampler.loop_state.X.shape == (3, 1)
+
+    X = np.load(path)
+    assert np.array_equal(X, np.hstack(chunks))
+    assert np.all(lincon.integration_domain(X) == 1)
+
+
+def test_integrated_autocorrelation_time():
+    """ Checks the estimate for independent samples and an AR(1) process with tau = (1 + phi) / (1 - phi) = 3 """
+    rng = np.random.RandomState(0)
+    assert abs(integrated_autocorrelation_time(rng.randn(20000)) - 1.) < 0.1
+
+    phi = 0.5
+    noise = rng.randn(20000)
+    x = np.zeros(20000)
+    for i in range(1, 20000):
+        x[i] = phi * x[i - 1] + noise[i]
+    assert abs(integrated_autocorrelation_time(x) - 3.) < 0.3
+    streaming = StreamingAutocorrelation()
+    for value in x:
+        streaming.update(value)
+    assert 2. < streaming.autocorrelation_time() < 4.
+
+
+def test_ess_automatic_n_skip():
+    """ Checks that n_skip is tuned by a pilot chain and the effective sample size is reported """
+    D = 5
+    lincon = LinearConstraints(np.eye(D), np.ones((D, 1)))
+    ess = EllipticalSliceSampler(200, lincon, 'auto', np.zeros((D, 1)))
+    ess.run()
+    assert isinstance(ess.n_skip, int) and ess.n_skip >= 0
+    assert 0. < ess.effective_sample_size() <= 200 * 200
+
+    batch_ess = BatchEllipticalSliceSampler(20, lincon, 'auto', np.zeros((D, 10)))
+    batch_ess.run()
+    assert isinstance(batch_ess.n_skip, int) and batch_ess.n_skip >= 0
+    assert np.all(lincon.integration_domain(batch_ess.loop_state.X) == 1)
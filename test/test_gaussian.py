@@ -0,0 +1,37 @@
+import numpy as np
+
+from LinConGauss import LinearConstraints, Gaussian, cached_cholesky
+
+# linear constraints in a space with a correlated Gaussian
+D = 6
+K = 2
+rng = np.random.RandomState(0)
+mean = rng.randn(D, 1)
+diag = rng.rand(D) + 0.5
+U = rng.randn(D, K)
+cov = np.diag(diag) + np.dot(U, U.T)
+lincon = LinearConstraints(rng.randn(4, D), rng.randn(4, 1))
+
+
+def test_whitening_preserves_domain():
+    """ Samples mapped back from the whitened space lie in the domain iff they lie in the whitened domain """
+    for gaussian in [Gaussian(mean, cov=cov), Gaussian(mean, chol=np.linalg.cholesky(cov)),
+                     Gaussian(mean, diag=diag, low_rank=U)]:
+        whitened_lincon = gaussian.whiten(lincon)
+        Z = rng.randn(gaussian.whitened_dim, 500)
+        assert np.array_equal(whitened_lincon.integration_domain(Z),
+                              lincon.integration_domain(gaussian.unwhiten(Z)))
+
+
+def test_unwhitened_moments():
+    """ Mapped standard normal samples have the desired mean and covariance """
+    for gaussian in [Gaussian(mean, cov=cov), Gaussian(mean, diag=diag, low_rank=U)]:
+        X = np.hstack(list(gaussian.iter_unwhiten(rng.randn(gaussian.whitened_dim, 100000), chunk_size=30000)))
+        assert X.shape == (D, 100000)
+        assert np.allclose(X.mean(axis=1, keepdims=True), mean, atol=0.1)
+        assert np.allclose(np.cov(X), cov, atol=0.2)
+
+
+def test_cholesky_cache():
+    """ The factorization of a covariance is reused """
+    assert cached_cholesky(cov.copy()) is cached_cholesky(cov)
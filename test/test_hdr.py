@@ -1,7 +1,10 @@
+import glob
+
 import numpy as np
+import pytest
 
-from LinConGauss import LinearConstraints
-from LinConGauss.multilevel_splitting import SubsetSimulation, HDR
+from LinConGauss import LinearConstraints, ShiftedLinearConstraints, Instrumentation, spawn_rngs
+from LinConGauss.multilevel_splitting import SubsetSimulation, HDR, Checkpoint
 
 # define some linear constraints
 n_lc = 5
@@ -25,3 +28,164 @@ def hdr_samples_in_domain():
 def test_conditional_probability():
     """ Check that conditional probabilities lie between 0 and 1 """
     assert np.all(hdr.tracker.conditional_probabilities > 0.) and np.all(hdr.tracker.conditional_probabilities <= 1.)
+
+def test_parallel_hdr():
+    """ Check that HDR with a process pool yields a complete sequence of valid nestings """
+    hdr_parallel = HDR(lincon, shifts, 100, x_inits, n_jobs=2)
+    hdr_parallel.run()
+    assert hdr_parallel.tracker.is_complete()
+    assert np.all(hdr_parallel.tracker.conditional_probabilities > 0.)
+    assert np.all(hdr_parallel.tracker.conditional_probabilities <= 1.)
+    assert np.all(lincon.integration_domain(hdr_parallel.tracker.X) == 1.)
+
+def test_hdr_stream_from_domain():
+    """ Check that samples streamed from the domain of interest lie within the domain """
+    chunks = list(hdr.iter_from_domain(50, chunk_size=20))
+    assert [chunk.shape[1] for chunk in chunks] == [20, 20, 10]
+    assert np.all(lincon.integration_domain(np.hstack(chunks)) == 1.)
+
+def test_hdr_instrumentation():
+    """ Check that instrumentation records counters per nesting and is exported by the tracker """
+    for n_jobs in [1, 2]:
+        instrumentation = Instrumentation()
+        hdr_instrumented = HDR(lincon, shifts, 20, x_inits, n_skip=1, n_jobs=n_jobs, instrumentation=instrumentation)
+        hdr_instrumented.run()
+
+        metrics = hdr_instrumented.tracker.export_metrics()
+        assert len(metrics['nestings']) == len(shifts)
+        assert metrics['totals']['samples'] == 20 * (len(shifts) - 1)
+        assert metrics['totals']['ess_steps'] >= 2 * metrics['totals']['samples']
+        assert metrics['totals']['active_slices'] >= metrics['totals']['ess_steps']
+        assert np.allclose([record['log_conditional_probability'] for record in metrics['nestings']],
+                           hdr_instrumented.tracker.log_conditional_probabilities)
+
+def test_hdr_resume(tmp_path, preempted_checkpoint):
+    """ Check that HDR resumed from a checkpoint (within a nesting or after one) equals an uninterrupted run """
+    for n_jobs, chunk_size, n_saves in [(1, 7, 3), (1, None, 2), (2, None, 2)]:
+        path = str(tmp_path / 'hdr_{}_{}.npz'.format(n_jobs, chunk_size))
+        np.random.seed(1)
+        hdr_full = HDR(lincon, shifts, 20, x_inits, n_jobs=n_jobs, checkpoint=Checkpoint(path + '.full', chunk_size))
+        hdr_full.run()
+
+        np.random.seed(1)
+        hdr_preempted = HDR(lincon, shifts, 20, x_inits, n_jobs=n_jobs,
+                            checkpoint=preempted_checkpoint(path, chunk_size, n_saves))
+        with pytest.raises(KeyboardInterrupt):
+            hdr_preempted.run()
+        if chunk_size is not None:
+            # every chunk of the chain in flight is written once, to its own file
+            chunk_paths = sorted(glob.glob(path + '.chain*.npz'))
+            assert len(chunk_paths) == n_saves - 1
+            for chunk_path in chunk_paths:
+                with np.load(chunk_path) as chunk:
+                    assert chunk['samples'].shape[1] == chunk_size
+
+        np.random.seed(2)
+        hdr_resumed = HDR(lincon, shifts, 20, x_inits, n_jobs=n_jobs, checkpoint=Checkpoint(path, chunk_size))
+        hdr_resumed.run(resume=True)
+        assert np.array_equal(hdr_resumed.tracker.log_conditional_probabilities,
+                              hdr_full.tracker.log_conditional_probabilities)
+        assert np.array_equal(hdr_resumed.tracker.X, hdr_full.tracker.X)
+
+def test_adaptive_hdr():
+    """ Check that adaptive HDR extends the nestings until the target error is reached or the budget is spent """
+    hdr_adaptive = HDR(lincon, shifts, 20, x_inits, target_error=0.2, timing=True)
+    hdr_adaptive.run()
+    assert hdr_adaptive.tracker.log_integral_standard_error() <= 0.2
+    assert len(hdr_adaptive.times) == len(shifts) and all(t >= 0. for t in hdr_adaptive.times)
+    assert np.all(lincon.integration_domain(hdr_adaptive.tracker.X) == 1.)
+
+    budget = 30 * len(shifts)
+    hdr_budget = HDR(lincon, shifts, 20, x_inits, target_error=1e-3, sample_budget=budget)
+    hdr_budget.run()
+    assert sum(nest.inside.shape[0] for nest in hdr_budget.tracker.nestings) <= budget
+
+def test_hdr_automatic_n_skip():
+    """ Check that HDR with automatic n_skip reports n_skip and effective sample size of every nesting """
+    hdr_auto = HDR(lincon, shifts, 50, x_inits, n_skip='auto')
+    hdr_auto.run()
+    metrics = hdr_auto.tracker.export_metrics()
+    assert all(record['n_skip'] >= 0 and record['effective_sample_size'] > 0 for record in metrics['nestings'])
+
+def test_single_precision():
+    """ Check that samples are kept in single precision and log conditional probabilities in double precision """
+    lincon_single = LinearConstraints(lincon.A, lincon.b, dtype=np.float32)
+    subset_single = SubsetSimulation(lincon_single, 16, 0.5)
+    subset_single.run(verbose=False)
+    hdr_single = HDR(lincon_single, subset_single.tracker.shift_sequence, 50, subset_single.tracker.x_inits())
+    hdr_single.run()
+    assert subset_single.tracker.x_inits().dtype == np.float32
+    assert hdr_single.tracker.X.dtype == np.float32
+    assert hdr_single.tracker.log_conditional_probabilities.dtype == np.float64
+    assert np.all(lincon_single.integration_domain(hdr_single.tracker.X) == 1)
+
+def test_hdr_union():
+    """ Check that subset simulation and HDR integrate over the union of half-spaces, not their intersection """
+    lincon_union = LinearConstraints(np.eye(3), -3. * np.ones((3, 1)), mode='Union')
+    exact = np.log(1. - (1. - 0.0013499) ** 3) # one minus the probability that no coordinate exceeds 3
+    subset_union = SubsetSimulation(lincon_union, 32, 0.5, rng=0)
+    subset_union.run(verbose=False)
+    hdr_union = HDR(lincon_union, subset_union.tracker.shift_sequence, 256, subset_union.tracker.x_inits(), rng=0)
+    hdr_union.run()
+    assert np.all(lincon_union.integration_domain(hdr_union.tracker.X) == 1)
+    assert abs(hdr_union.tracker.log_integral() - exact) < 4 * hdr_union.tracker.log_integral_standard_error()
+
+def test_hdr_recycle():
+    """ Check that recycling samples saves ESS steps and that the recycled samples are the first samples of the next
+    nesting """
+    lincon_box = LinearConstraints(np.eye(2), -np.array([[1.5], [1.]]))
+    subset_box = SubsetSimulation(lincon_box, 16, 0.5, rng=0)
+    subset_box.run(verbose=False)
+    shifts_box, x_inits_box = subset_box.tracker.shift_sequence, subset_box.tracker.x_inits()
+
+    for seed in range(10):
+        X0 = np.random.RandomState(seed).randn(2, 50)
+        instrumentation = Instrumentation()
+        hdr_recycled = HDR(lincon_box, shifts_box, 50, x_inits_box, n_skip=1, recycle=True,
+                           instrumentation=instrumentation, rng=seed)
+        hdr_recycled.run(X0=X0)
+        assert instrumentation.to_dict()['totals']['samples'] < 50 * (len(shifts_box) - 1)
+        assert np.all(lincon_box.integration_domain(hdr_recycled.tracker.X) == 1.)
+
+        # the samples of the first nesting that lie inside the second one are evaluated first in the second nesting
+        recycled = X0[:, hdr_recycled.tracker.nestings[0].inside]
+        inside_next = ShiftedLinearConstraints(lincon_box.A, lincon_box.b, shifts_box[1]).integration_domain(recycled)
+        assert np.array_equal(hdr_recycled.tracker.nestings[1].inside[:recycled.shape[1]], inside_next == 1)
+
+    with pytest.raises(ValueError):
+        HDR(lincon_box, shifts_box, 50, x_inits_box, n_jobs=2, recycle=True)
+
+def test_hdr_rng(tmp_path, preempted_checkpoint):
+    """ Check that runs with a seed are reproducible, independent of n_jobs and leave the global random state alone """
+    global_state = np.random.get_state()[1].copy()
+    subset_seeded = [SubsetSimulation(lincon, 16, 0.5, rng=3) for i in range(2)]
+    for subset in subset_seeded:
+        subset.run(verbose=False)
+    assert np.array_equal(subset_seeded[0].tracker.shift_sequence, subset_seeded[1].tracker.shift_sequence)
+
+    # child streams are seeded with 4 x 63 bits from the parent and respawned from their entropy
+    entropy, children = spawn_rngs(np.random.default_rng(4), 3)
+    assert len(entropy) == 4 and all(0 <= e < 2**63 for e in entropy)
+    assert np.array_equal(spawn_rngs(None, 3, np.asarray(entropy))[1][2].random(5), children[2].random(5))
+
+    hdr_serial = [HDR(lincon, shifts, 20, x_inits, rng=np.random.default_rng(4)) for i in range(2)]
+    hdr_parallel = [HDR(lincon, shifts, 20, x_inits, n_jobs=n_jobs, rng=4) for n_jobs in [1, 2, 3]]
+    for hdr_seeded in hdr_serial + hdr_parallel:
+        hdr_seeded.run()
+    assert np.array_equal(hdr_serial[0].tracker.X, hdr_serial[1].tracker.X)
+    for hdr_seeded in hdr_parallel[1:]:
+        assert np.array_equal(hdr_seeded.tracker.log_conditional_probabilities,
+                              hdr_parallel[0].tracker.log_conditional_probabilities)
+        assert np.array_equal(hdr_seeded.tracker.X, hdr_parallel[0].tracker.X)
+    assert np.array_equal(np.random.get_state()[1], global_state)
+
+    # the state of the generator is checkpointed
+    path = str(tmp_path / 'hdr_rng.npz')
+    hdr_preempted = HDR(lincon, shifts, 20, x_inits, checkpoint=preempted_checkpoint(path, 7, 3), rng=4)
+    with pytest.raises(KeyboardInterrupt):
+        hdr_preempted.run()
+    hdr_resumed = HDR(lincon, shifts, 20, x_inits, checkpoint=Checkpoint(path, 7), rng=5)
+    hdr_resumed.run(resume=True)
+    hdr_full = HDR(lincon, shifts, 20, x_inits, checkpoint=Checkpoint(path + '.full', 7), rng=4)
+    hdr_full.run()
+    assert np.array_equal(hdr_resumed.tracker.X, hdr_full.tracker.X)
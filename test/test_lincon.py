@@ -1,6 +1,9 @@
 import numpy as np
+import pytest
 
-from LinConGauss import LinearConstraints, ShiftedLinearConstraints
+from LinConGauss import LinearConstraints, ShiftedLinearConstraints, ShiftedMargins, find_feasible_point, \
+    prune_constraints
+from LinConGauss.multilevel_splitting import SubsetSimulation, HDR
 
 # setting up linear constraints
 d = 15
@@ -14,12 +17,111 @@ def test_lincon_evaluation():
     assert lincon.evaluate(np.random.randn(d, n)).shape == (d, n)
 
 def test_union_intersection():
-    """ Tests whether union and intersection just have the opposite value of 0 and 1 """
+    """ Tests whether union and intersection indicate that all or any of the linear functions are >= 0 """
     X = np.random.randn(d, 100)
-    assert np.array_equal(lincon.indicator_intersection(X), 1-lincon.indicator_union(X))
+    fx = lincon.evaluate(X)
+    assert np.array_equal(lincon.indicator_intersection(X), np.all(fx >= 0, axis=0))
+    assert np.array_equal(lincon.indicator_union(X), np.any(fx >= 0, axis=0))
+    assert np.all(lincon.indicator_intersection(X) <= lincon.indicator_union(X))
 
 def test_shifted_lincon():
     shift = 1.
     shifted_lincon = ShiftedLinearConstraints(lincon.A, lincon.b, shift=shift)
     X = np.random.randn(d, 1)
-    assert np.allclose(lincon.evaluate(X)+1., shifted_lincon.evaluate(X))
\ No newline at end of file
+    assert np.allclose(lincon.evaluate(X)+1., shifted_lincon.evaluate(X))
+
+def test_sparse_lincon():
+    """ Tests that sparse matrices and linear operators give the same constraint values as dense matrices """
+    sparse = pytest.importorskip('scipy.sparse')
+    linalg = pytest.importorskip('scipy.sparse.linalg')
+
+    X = np.random.randn(d, 10)
+    sparse_lincon = LinearConstraints(sparse.csr_matrix(A), b)
+    operator_lincon = LinearConstraints(linalg.aslinearoperator(A), b)
+    assert np.allclose(sparse_lincon.evaluate(X), lincon.evaluate(X))
+    assert np.allclose(operator_lincon.evaluate(X), lincon.evaluate(X))
+    assert np.array_equal(sparse_lincon.integration_domain(X), lincon.integration_domain(X))
+
+
+def test_sparse_integration():
+    """ Tests that the multilevel splitting stack runs with a sparse constraint matrix """
+    sparse = pytest.importorskip('scipy.sparse')
+
+    sparse_lincon = LinearConstraints(sparse.csr_matrix(np.eye(d)), b)
+    subset_simulator = SubsetSimulation(sparse_lincon, 16, 0.5)
+    subset_simulator.run(verbose=False)
+    hdr = HDR(sparse_lincon, subset_simulator.tracker.shift_sequence, 32, subset_simulator.tracker.x_inits())
+    hdr.run()
+    assert np.all(sparse_lincon.integration_domain(hdr.tracker.X) == 1)
+
+
+def test_feasible_point():
+    """ Tests that the feasible point lies in the domain, also for tiny domain probabilities, and that infeasible
+    constraints are reported """
+    x = find_feasible_point(lincon)
+    assert lincon.integration_domain(x) == 1
+
+    tiny_lincon = LinearConstraints(np.eye(d), -6. * np.ones((d, 1)))
+    assert tiny_lincon.integration_domain(find_feasible_point(tiny_lincon)) == 1
+
+    infeasible_lincon = LinearConstraints(np.asarray([[1.], [-1.]]), np.asarray([[-1.], [-1.]]))
+    with pytest.raises(ValueError, match='at most'):
+        find_feasible_point(infeasible_lincon)
+
+def test_chunked_evaluation(tmp_path):
+    """ Tests that evaluation in small blocks, also with A memory-mapped from disk, equals the full evaluation """
+    rng = np.random.RandomState(0)
+    X = rng.randn(d, 500)
+    fX = lincon.evaluate(X)
+    np.save(str(tmp_path / 'A.npy'), A)
+    A_memmap = np.load(str(tmp_path / 'A.npy'), mmap_mode='r')
+
+    for A_chunked in [A, A_memmap]:
+        for offset in [b, b + 3.]:
+            for mode in ['Intersection', 'Union']:
+                lincon_full = LinearConstraints(A, offset, mode=mode)
+                lincon_chunked = LinearConstraints(A_chunked, offset, mode=mode, block_size=40)
+                assert np.array_equal(lincon_chunked.integration_domain(X), lincon_full.integration_domain(X))
+            assert np.allclose(LinearConstraints(A_chunked, b, block_size=40).min_evaluation(X), fX.min(axis=0))
+
+def test_prune_constraints():
+    """ Tests that duplicate, parallel, constant and implied constraints are removed without changing the domain """
+    A_box = np.vstack((np.eye(3), -np.eye(3)))
+    A_redundant = np.vstack((A_box, 2. * A_box[:2], [[1., 1., 0.], [0., 0., 0.]], [[1., -1., 1.]]))
+    b_redundant = np.vstack((np.ones((6, 1)), [[3.], [1.], [2.5], [1.], [0.5]]))
+    X = 2. * np.random.RandomState(0).randn(3, 2000)
+
+    # a constant, satisfied constraint makes the union cover the whole space, hence it is dropped for the union
+    for mode, rows, n_reduced in [('Intersection', np.arange(11), 7), ('Union', np.delete(np.arange(11), 9), 8)]:
+        lincon_redundant = LinearConstraints(A_redundant[rows], b_redundant[rows], mode=mode)
+        lincon_pruned, index_map = prune_constraints(lincon_redundant)
+        assert lincon_pruned.N_constraints == n_reduced
+        assert index_map.shape == (rows.shape[0],) and index_map.max() == n_reduced - 1
+        assert np.array_equal(lincon_pruned.integration_domain(X), lincon_redundant.integration_domain(X))
+    lincon_everything, _ = prune_constraints(LinearConstraints(A_redundant, b_redundant, mode='Union'))
+    assert lincon_everything.N_constraints == 1 and np.all(lincon_everything.integration_domain(X) == 1)
+
+    # the second constraint (x_2 >= -1) is tighter than its multiple 2 x_2 + 1 >= 0 and absorbs it
+    _, index_map = prune_constraints(LinearConstraints(A_redundant, b_redundant))
+    assert index_map[7] == index_map[1] and index_map[6] == index_map[0]
+    # x_1 + x_2 + 2.5 >= 0 is implied by the box and the constant constraint is always satisfied
+    assert index_map[8] == -1 and index_map[9] == -1
+
+def test_shifted_margins():
+    """ Tests that the margins decide membership in the nestings of all shifts like ShiftedLinearConstraints """
+    X = np.random.RandomState(2).randn(d, 500)
+    shifts = np.array([2., 1., 0.5, 0.])
+    view = ShiftedMargins(lincon, X)
+    assert np.array_equal(ShiftedMargins(lincon, AX=A @ X).margins, view.margins)
+    for shift, n_inside in zip(shifts, view.n_inside(shifts)):
+        inside = ShiftedLinearConstraints(A, b, shift).integration_domain(X)
+        assert np.array_equal(view.integration_domain(shift), inside)
+        assert n_inside == inside.sum()
+
+    union_lincon = LinearConstraints(A, b, mode='Union')
+    union_view = ShiftedMargins(union_lincon, X)
+    assert np.array_equal(ShiftedMargins(union_lincon, AX=A @ X).margins, union_view.margins)
+    for shift, n_inside in zip(shifts, union_view.n_inside(-shifts)):
+        inside = LinearConstraints(A, b - shift, mode='Union').integration_domain(X)
+        assert np.array_equal(union_view.integration_domain(-shift), inside)
+        assert n_inside == inside.sum()
@@ -0,0 +1,42 @@
+import os
+
+import numpy as np
+
+from LinConGauss import LinearConstraints
+from LinConGauss.multilevel_splitting import ShiftSequenceCache, integrate
+
+# box x_1 >= 1.5, x_2 >= 1 with probability 0.0668072 * 0.1586553
+lincon = LinearConstraints(np.eye(2), -np.array([[1.5], [1.]]))
+
+
+def test_integrate_with_cache(tmp_path):
+    """ Checks that a repeated integral reuses the cached shift sequence and that the key depends on the problem """
+    cache = ShiftSequenceCache(str(tmp_path / 'cache'))
+    hdr, cached, _, _ = integrate(lincon, 64, cache=cache, rng=0)
+    assert not cached
+    hdr_repeated, cached, _, _ = integrate(LinearConstraints(lincon.A.copy(), lincon.b.copy()), 64, cache=cache, rng=1)
+    assert cached
+    assert np.array_equal(hdr_repeated.shift_sequence, hdr.shift_sequence)
+    assert abs(hdr_repeated.tracker.log_integral() - np.log(0.0668072 * 0.1586553)) < 1.
+
+    key = cache.key(lincon, 0.5, 64)
+    assert cache.key(lincon, 0.3, 64) != key and cache.key(lincon, 0.5, 32) != key
+    assert cache.key(LinearConstraints(lincon.A, lincon.b + 1.), 0.5, 64) != key
+    assert cache.key(LinearConstraints(lincon.A, lincon.b, mode='Union'), 0.5, 64) != key
+
+
+def test_cache_eviction(tmp_path):
+    """ Checks that the least recently used entry is evicted once the cache exceeds its size """
+    cache = ShiftSequenceCache(str(tmp_path))
+    shifts, x_inits = np.array([1., 0.]), np.zeros((2, 2))
+    cache.put('a', shifts, x_inits)
+    size = os.path.getsize(cache._path('a'))
+    cache.max_bytes = int(2.5 * size)
+    cache.put('b', shifts, x_inits)
+    os.utime(cache._path('a'), (1, 1))
+    os.utime(cache._path('b'), (2, 2))
+
+    assert cache.get('a') is not None  # a is now the most recently used entry
+    cache.put('c', shifts, x_inits)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
@@ -1,7 +1,8 @@
 import numpy as np
+import pytest
 
 from LinConGauss import LinearConstraints
-from LinConGauss.multilevel_splitting import SubsetSimulation
+from LinConGauss.multilevel_splitting import SubsetSimulation, Checkpoint
 
 # define some linear constraints
 n_lc = 5
@@ -21,3 +22,33 @@ def subset_finds_domain():
 def shifts_larger_zero():
     """ Test that shifts found by subset simulation are greater/equal to 0 """
     assert np.all(subset_simulator.tracker.shift_sequence >= 0.)
+
+
+def test_population_subset_simulation():
+    """ Test that subset simulation with many seeded chains finds the domain of interest """
+    population_simulator = SubsetSimulation(lincon, 16, 0.5, population=True)
+    population_simulator.run(verbose=False)
+    assert population_simulator.tracker.is_complete()
+    assert np.all(population_simulator.tracker.shift_sequence >= 0.)
+    assert lincon.integration_domain(population_simulator.tracker.x_inits()[:, -1, None]) == 1.
+
+
+def test_subset_simulation_resume(tmp_path, preempted_checkpoint):
+    """ Test that subset simulation resumed from a checkpoint equals an uninterrupted run """
+    for chunk_size, n_saves in [(5, 4), (None, 2)]:
+        path = str(tmp_path / 'subset_{}.npz'.format(chunk_size))
+        np.random.seed(1)
+        full_simulator = SubsetSimulation(lincon, 16, 0.5)
+        full_simulator.run(verbose=False)
+
+        np.random.seed(1)
+        preempted_simulator = SubsetSimulation(lincon, 16, 0.5, checkpoint=preempted_checkpoint(path, chunk_size,
+                                                                                               n_saves))
+        with pytest.raises(KeyboardInterrupt):
+            preempted_simulator.run(verbose=False)
+
+        np.random.seed(2)
+        resumed_simulator = SubsetSimulation(lincon, 16, 0.5, checkpoint=Checkpoint(path, chunk_size))
+        resumed_simulator.run(verbose=False, resume=True)
+        assert np.array_equal(resumed_simulator.tracker.shift_sequence, full_simulator.tracker.shift_sequence)
+        assert np.array_equal(resumed_simulator.tracker.x_inits(), full_simulator.tracker.x_inits())